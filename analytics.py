@@ -0,0 +1,193 @@
+"""
+Attempt history and per-question analytics.
+
+Every finished attempt is appended to the attempts table, and the
+per-question aggregates in question_stats (attempt count, accuracy and a
+mergeable time sketch) are updated in the same transaction. Reports read
+the aggregates through indexes and never rescan raw attempts.
+"""
+import math
+import os
+import sqlite3
+import struct
+import threading
+import time
+
+DEFAULT_DB_PATH = os.environ.get("QUIZ_ANALYTICS_DB", ".analytics.db")
+
+# Relative accuracy of the time quantiles
+SKETCH_ALPHA = 0.02
+# Times are bucketed in milliseconds; anything faster counts as this
+SKETCH_MIN_MS = 1.0
+
+_BUCKET = struct.Struct("<iI")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attempts (
+    id INTEGER PRIMARY KEY,
+    finished REAL NOT NULL,
+    sheet TEXT NOT NULL,
+    bank TEXT,
+    score INTEGER NOT NULL,
+    answered INTEGER NOT NULL,
+    total_time REAL NOT NULL,
+    results BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS question_stats (
+    sheet TEXT NOT NULL,
+    question INTEGER NOT NULL,
+    attempts INTEGER NOT NULL,
+    correct INTEGER NOT NULL,
+    accuracy REAL NOT NULL,
+    time_sum REAL NOT NULL,
+    p50_ms REAL NOT NULL,
+    p90_ms REAL NOT NULL,
+    sketch BLOB NOT NULL,
+    PRIMARY KEY (sheet, question)
+);
+CREATE INDEX IF NOT EXISTS attempts_sheet ON attempts (sheet);
+CREATE INDEX IF NOT EXISTS question_stats_accuracy ON question_stats (sheet, accuracy);
+CREATE INDEX IF NOT EXISTS question_stats_p90 ON question_stats (sheet, p90_ms);
+"""
+
+# Per-question result stored with each attempt: question number, correct,
+# seconds. Attempts recorded before numbers were widened to 32 bits used
+# "<HBf"; len(results) / answered (7 or 9 bytes) tells the two apart.
+_RESULT = struct.Struct("<IBf")
+
+
+class TimeSketch:
+    """
+    Mergeable quantile sketch over answer times (log-spaced buckets, as in
+    DDSketch): any quantile is within SKETCH_ALPHA relative error, and two
+    sketches merge by adding bucket counts.
+    """
+
+    __slots__ = ("counts", "count")
+
+    GAMMA = (1 + SKETCH_ALPHA) / (1 - SKETCH_ALPHA)
+    LOG_GAMMA = math.log(GAMMA)
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+
+    def add(self, seconds):
+        ms = max(seconds * 1000, SKETCH_MIN_MS)
+        index = math.ceil(math.log(ms) / self.LOG_GAMMA)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+
+    def merge(self, other):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+
+    def quantile(self, q):
+        """Approximate q-quantile in milliseconds (0 when empty)"""
+        if not self.count:
+            return 0.0
+        rank = q * (self.count - 1)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen > rank:
+                return 2 * self.GAMMA ** index / (self.GAMMA + 1)
+        return 2 * self.GAMMA ** max(self.counts) / (self.GAMMA + 1)
+
+    def to_bytes(self):
+        return b"".join(_BUCKET.pack(index, count) for index, count in sorted(self.counts.items()))
+
+    @classmethod
+    def from_bytes(cls, data):
+        sketch = cls()
+        for index, count in _BUCKET.iter_unpack(data):
+            sketch.counts[index] = count
+            sketch.count += count
+        return sketch
+
+
+class AnalyticsStore:
+    """SQLite (WAL) store for attempts and their per-question aggregates"""
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def record_attempt(self, sheet, bank, score, total_time, results):
+        """
+        Append one finished attempt and fold it into the per-question stats.
+        results is an iterable of (question number, correct, seconds) for the
+        questions the candidate answered.
+        """
+        results = list(results)
+        blob = b"".join(_RESULT.pack(number, bool(correct), seconds) for number, correct, seconds in results)
+        numbers = [number for number, _, _ in results]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO attempts (finished, sheet, bank, score, answered, total_time, results) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (time.time(), sheet, bank, score, len(results), total_time, blob),
+                )
+                existing = {}
+                for chunk_start in range(0, len(numbers), 500):
+                    chunk = numbers[chunk_start:chunk_start + 500]
+                    rows = self._conn.execute(
+                        "SELECT question, attempts, correct, time_sum, sketch FROM question_stats "
+                        f"WHERE sheet = ? AND question IN ({','.join('?' * len(chunk))})",
+                        (sheet, *chunk),
+                    )
+                    for question, attempts, correct, time_sum, sketch in rows:
+                        existing[question] = [attempts, correct, time_sum, TimeSketch.from_bytes(sketch)]
+                updates = []
+                for number, correct, seconds in results:
+                    stats = existing.setdefault(number, [0, 0, 0.0, TimeSketch()])
+                    stats[0] += 1
+                    stats[1] += bool(correct)
+                    stats[2] += seconds
+                    stats[3].add(seconds)
+                for number, (attempts, correct, time_sum, sketch) in existing.items():
+                    updates.append((
+                        sheet, number, attempts, correct, correct / attempts, time_sum,
+                        sketch.quantile(0.5), sketch.quantile(0.9), sketch.to_bytes(),
+                    ))
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO question_stats "
+                    "(sheet, question, attempts, correct, accuracy, time_sum, p50_ms, p90_ms, sketch) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    updates,
+                )
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _report(self, sheet, order_by, limit, min_attempts):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT question, attempts, accuracy, p50_ms, p90_ms FROM question_stats "
+                f"WHERE sheet = ? AND attempts >= ? ORDER BY {order_by} LIMIT ?",
+                (sheet, min_attempts, limit),
+            ).fetchall()
+        return [
+            {"question": question, "attempts": attempts, "accuracy": accuracy, "p50_ms": p50, "p90_ms": p90}
+            for question, attempts, accuracy, p50, p90 in rows
+        ]
+
+    def hardest(self, sheet, limit=10, min_attempts=1):
+        """Questions with the lowest accuracy"""
+        return self._report(sheet, "accuracy ASC, attempts DESC", limit, min_attempts)
+
+    def slowest(self, sheet, limit=10, min_attempts=1):
+        """Questions with the highest 90th-percentile answer time"""
+        return self._report(sheet, "p90_ms DESC", limit, min_attempts)
+
+    def attempt_count(self, sheet):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM attempts WHERE sheet = ?", (sheet,)).fetchone()[0]
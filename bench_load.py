@@ -0,0 +1,262 @@
+"""
+Headless load and latency benchmark for test_engine.py.
+
+Drives the app through Streamlit's AppTest (no browser) for N simulated
+candidates per sheet. Candidates are stepped round-robin, one action at a
+time, so their sessions coexist the way concurrent users' do.
+
+    python bench_load.py                      # run and print a report
+    python bench_load.py --save-baseline      # run and store bench_baseline.json
+    python bench_load.py --check              # run and fail on regressions
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+from streamlit.testing.v1 import AppTest
+
+import image_assets
+import prefetch
+import question_bank
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_FILE = os.path.join(APP_DIR, "test_engine.py")
+BASELINE_FILE = os.path.join(APP_DIR, "bench_baseline.json")
+
+# Metrics compared against the baseline (all "lower is better")
+TRACKED_METRICS = [
+    "rerun_p50_ms",
+    "rerun_p95_ms",
+    "rerun_p99_ms",
+    "session_state_bytes",
+    "load_data_ms_per_rerun",
+    "image_lookup_ms_per_rerun",
+    "scoring_ms_per_rerun",
+]
+
+
+class StageTimer:
+    """
+    Accumulates wall time spent in patched library functions. Calls made by
+    prefetch threads are left out: they run between reruns, not in them.
+    """
+
+    def __init__(self):
+        self.totals = {}
+        self._patches = []
+
+    def wrap(self, owner, name, stage):
+        original = getattr(owner, name)
+        totals = self.totals
+
+        def timed(*args, **kwargs):
+            if threading.current_thread().name.startswith(prefetch.THREAD_NAME):
+                return original(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                totals[stage] = totals.get(stage, 0.0) + time.perf_counter() - start
+
+        self._patches.append((owner, name, original))
+        setattr(owner, name, timed)
+
+    def restore(self):
+        for owner, name, original in reversed(self._patches):
+            setattr(owner, name, original)
+        self._patches = []
+
+
+def _deep_sizeof(obj, seen=None):
+    """Approximate retained size of a value and everything it contains"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_sizeof(k, seen) + _deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, "__slots__"):
+        size += sum(_deep_sizeof(getattr(obj, name), seen) for name in obj.__slots__ if hasattr(obj, name))
+    elif hasattr(obj, "__dict__"):
+        size += _deep_sizeof(vars(obj), seen)
+    return size
+
+
+def session_state_bytes(at):
+    """Deep size of a session's user-visible state (widget values included)"""
+    state = getattr(at, "_session_state", at.session_state)
+    return _deep_sizeof(dict(state.filtered_state))
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Candidate:
+    """One simulated exam session, advanced one action per step()"""
+
+    def __init__(self, sheet, rng, max_questions, timeout):
+        self.sheet = sheet
+        self.rng = rng
+        self.max_questions = max_questions
+        self.at = AppTest.from_file(APP_FILE, default_timeout=timeout)
+        self.latencies = []
+        self.answered = 0
+        self.done = False
+        self._actions = self._script()
+
+    def _run(self, element=None):
+        start = time.perf_counter()
+        if element is None:
+            self.at.run()
+        else:
+            element.run()
+        self.latencies.append(time.perf_counter() - start)
+        if self.at.exception:
+            raise RuntimeError(f"{self.sheet}: app raised {self.at.exception[0].value}")
+
+    def _script(self):
+        at = self.at
+        self._run()
+        yield
+        self._run(at.selectbox[0].select(self.sheet))
+        yield
+        self._run(at.button(key="start_btn").click())
+        yield
+        while at.session_state.page == "quiz":
+            index = at.session_state.current_question
+            if self.max_questions and self.answered == self.max_questions:
+                # Skip ahead to the last question so the run still reaches results
+                at.session_state.current_question = len(at.session_state.quiz) - 1
+                index = at.session_state.current_question
+                self._run()
+                yield
+            if at.multiselect:
+                choices = at.multiselect[0].options
+                self._run(at.multiselect[0].set_value(self.rng.sample(choices, min(2, len(choices)))))
+                yield
+            elif at.radio:
+                self._run(at.radio[0].set_value(self.rng.choice(at.radio[0].options)))
+                yield
+            self._run(at.button(key=f"answer_btn_{index}").click())
+            yield
+            self.answered += 1
+            if index > 0 and self.rng.random() < 0.05:
+                self._run(at.button(key="prev_btn").click())
+                yield
+                self._run(at.button(key="next_btn").click())
+                yield
+            self._run(at.button(key="next_btn").click())
+            yield
+        self.state_bytes = session_state_bytes(at)
+        self._run(at.button(key="restart_btn").click())
+        yield
+
+    def step(self):
+        try:
+            next(self._actions)
+        except StopIteration:
+            self.done = True
+
+
+def run_benchmark(candidates, sheets=None, max_questions=0, seed=0, timeout=30):
+    os.chdir(APP_DIR)
+    sheets = sheets or list(question_bank.open_bank())
+    timer = StageTimer()
+    timer.wrap(question_bank.BankWatcher, "bank", "load_data")
+    timer.wrap(question_bank.QuestionBank, "__getitem__", "load_data")
+    timer.wrap(image_assets.ImageIndex, "lookup", "image_lookup")
+    timer.wrap(image_assets.ImageCache, "variants", "image_lookup")
+    timer.wrap(image_assets.ImageCache, "data_uri", "image_lookup")
+    timer.wrap(image_assets.ImageCache, "static_url", "image_lookup")
+    timer.wrap(question_bank.Question, "selection_mask", "scoring")
+
+    rng = random.Random(seed)
+    sessions = [
+        Candidate(sheet, random.Random(rng.random()), max_questions, timeout)
+        for sheet in sheets for _ in range(candidates)
+    ]
+    start = time.perf_counter()
+    try:
+        active = list(sessions)
+        while active:
+            for candidate in active:
+                candidate.step()
+            active = [candidate for candidate in active if not candidate.done]
+    finally:
+        timer.restore()
+    wall = time.perf_counter() - start
+
+    latencies = [latency for candidate in sessions for latency in candidate.latencies]
+    reruns = len(latencies)
+    results = {
+        "sessions": len(sessions),
+        "reruns": reruns,
+        "wall_s": wall,
+        "rerun_p50_ms": percentile(latencies, 50) * 1000,
+        "rerun_p95_ms": percentile(latencies, 95) * 1000,
+        "rerun_p99_ms": percentile(latencies, 99) * 1000,
+        "session_state_bytes": max(candidate.state_bytes for candidate in sessions),
+    }
+    for stage in ("load_data", "image_lookup", "scoring"):
+        results[f"{stage}_ms_per_rerun"] = timer.totals.get(stage, 0.0) * 1000 / max(reruns, 1)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of human-readable regressions past the tolerance"""
+    regressions = []
+    for metric in TRACKED_METRICS:
+        if metric not in baseline:
+            continue
+        limit = baseline[metric] * (1 + tolerance)
+        if results[metric] > limit:
+            regressions.append(f"{metric}: {results[metric]:.3f} > {limit:.3f} (baseline {baseline[metric]:.3f})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--candidates", type=int, default=2, help="simulated candidates per sheet")
+    parser.add_argument("--sheet", action="append", help="limit to these sheets (repeatable)")
+    parser.add_argument("--max-questions", type=int, default=0,
+                        help="answer at most this many questions per candidate, then finish (0 = all)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--check", action="store_true", help="exit 1 if a tracked metric regresses")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed regression (fraction)")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.candidates, args.sheet, args.max_questions, args.seed)
+    for name, value in results.items():
+        print(f"{name:<28}{value:>12.3f}" if isinstance(value, float) else f"{name:<28}{value:>12}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    if args.check:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
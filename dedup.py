@@ -0,0 +1,210 @@
+"""
+Near-duplicate detection across sheets, and the "mixed exam" builder.
+
+Each question (text plus options) becomes a set of stemmed words, summarized
+by a MinHash signature. Signatures are split into LSH bands; only questions
+that share a band bucket are compared, so clustering is far from quadratic
+in the bank size. Candidate pairs whose estimated Jaccard similarity reaches
+DUPLICATE_THRESHOLD are merged into one cluster.
+
+    python dedup.py          # list the near-duplicate clusters of the bank
+"""
+import functools
+import random
+import time
+import zlib
+
+from search_index import tokenize
+
+NUM_PERMUTATIONS = 128
+BANDS = 32
+ROWS = NUM_PERMUTATIONS // BANDS
+# Estimated Jaccard similarity at which two questions count as the same one
+# (rewordings of one question in this bank score 0.55-0.9)
+DUPLICATE_THRESHOLD = 0.55
+# Words per shingle; single words tolerate reordered sentences best
+SHINGLE_SIZE = 1
+
+_PRIME = (1 << 31) - 1
+
+
+# numpy is imported on first use: the quiz app only needs stratified_sample
+# from this module, and clustering runs when a snapshot is compiled
+@functools.lru_cache(maxsize=None)
+def _hash_parameters():
+    """(a, b) coefficients of the NUM_PERMUTATIONS hash functions a*x+b mod _PRIME"""
+    import numpy as np
+
+    rng = np.random.default_rng(0x51A7)
+    return (rng.integers(1, _PRIME, NUM_PERMUTATIONS, dtype=np.uint64),
+            rng.integers(0, _PRIME, NUM_PERMUTATIONS, dtype=np.uint64))
+
+
+def shingles(question):
+    """Hashed word n-grams of a question's text and options"""
+    import numpy as np
+
+    words = tokenize(question.text)
+    for option in question.options:
+        words.extend(tokenize(option))
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+    if len(words) < SHINGLE_SIZE:
+        grams = [" ".join(words)]
+    else:
+        grams = [" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)]
+    return np.unique(np.array([zlib.crc32(gram.encode("utf-8")) % _PRIME for gram in grams], dtype=np.uint64))
+
+
+def signature(question):
+    """MinHash signature (NUM_PERMUTATIONS values) of a question; None if it has no words"""
+    import numpy as np
+
+    a, b = _hash_parameters()
+    values = shingles(question)
+    if not len(values):
+        return None
+    return ((a[:, None] * values[None, :] + b[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+
+
+def _matches_any(signatures, group, j):
+    """
+    Whether question j is a near duplicate of any question in group. The
+    group is compared in growing chunks, so a match near its start (the
+    common case in a cluster) stops early.
+    """
+    import numpy as np
+
+    start, size = 0, 1
+    while start < len(group):
+        chunk = signatures[group[start:start + size]]
+        if np.count_nonzero(chunk == signatures[j], axis=1).max() >= DUPLICATE_THRESHOLD * NUM_PERMUTATIONS:
+            return True
+        start += size
+        size *= 8
+    return False
+
+
+def find_clusters(questions, count=None):
+    """
+    Cluster label per question: questions with the same label are near
+    duplicates. Labels are the index of the cluster's first question; a
+    question without words is a cluster of its own.
+    questions may be any iterable of `count` questions (default len(questions));
+    only the signatures are kept, in one preallocated array.
+    """
+    import numpy as np
+
+    if count is None:
+        count = len(questions)
+    signatures = np.empty((count, NUM_PERMUTATIONS), dtype=np.uint32)
+    blank = np.zeros(count, dtype=bool)
+    for i, question in enumerate(questions):
+        values = signature(question)
+        if values is None:
+            blank[i] = True
+        else:
+            signatures[i] = values
+    candidates = np.flatnonzero(~blank)
+    parent = list(range(count))
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for band in range(BANDS):
+        # Bucket by sorting the band's rows (as opaque byte strings) rather
+        # than through a dict, so a band costs a few bytes per question
+        keys = np.ascontiguousarray(signatures[candidates, band * ROWS:(band + 1) * ROWS]).view(f"V{ROWS * 4}").ravel()
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        bounds = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1], [True])))
+        for bucket in np.flatnonzero(np.diff(bounds) > 1):
+            members = candidates[order[bounds[bucket]:bounds[bucket + 1]]].tolist()
+            # Every pair in the bucket counts (similarity is not transitive),
+            # but a question only needs one match per cluster to join it: the
+            # bucket's members so far are kept by cluster, and each cluster
+            # is searched for a match until one is found
+            seen = {}
+            for j in members:
+                own = root(j)
+                joined = [label for label in seen if label == own]
+                joined.extend(
+                    label for label, group in seen.items()
+                    if label != own and _matches_any(signatures, group, j)
+                )
+                group = [j]
+                for label in joined:
+                    group.extend(seen.pop(label))
+                    parent[max(root(j), root(label))] = min(root(j), root(label))
+                seen[root(j)] = group
+    return [root(i) for i in range(count)]
+
+
+def stratified_sample(strata, clusters, count, rng=random):
+    """
+    Pick up to `count` questions with distinct cluster labels from several
+    strata (lists of question indices, e.g. one per sheet). Each stratum gets
+    a share proportional to its number of distinct questions; shares left
+    unfilled are handed to the strata that still have questions. Returns the
+    picked indices in random order.
+    """
+    pools = []
+    for stratum in strata:
+        stratum = list(stratum)
+        rng.shuffle(stratum)
+        pools.append(stratum)
+    sizes = [len({clusters[i] for i in stratum}) for stratum in pools]
+    total = sum(sizes)
+    count = min(count, len({clusters[i] for stratum in pools for i in stratum}))
+    # Largest-remainder allocation of the count over the strata
+    quotas = [count * size // total if total else 0 for size in sizes]
+    by_remainder = sorted(range(len(pools)), key=lambda s: count * sizes[s] % max(total, 1), reverse=True)
+    for s in by_remainder[:count - sum(quotas)]:
+        quotas[s] += 1
+
+    used = set()
+    picked = []
+    while len(picked) < count:
+        for s, pool in enumerate(pools):
+            while quotas[s] > 0 and pool:
+                index = pool.pop()
+                if clusters[index] not in used:
+                    used.add(clusters[index])
+                    picked.append(index)
+                    quotas[s] -= 1
+        # Hand unfilled shares to strata that still have questions
+        shortfall = count - len(picked)
+        open_strata = [s for s, pool in enumerate(pools) if pool]
+        if not shortfall or not open_strata:
+            break
+        quotas = [0] * len(pools)
+        for k in range(shortfall):
+            quotas[open_strata[k % len(open_strata)]] += 1
+    rng.shuffle(picked)
+    return picked
+
+
+def main():
+    from question_bank import open_bank
+
+    bank = open_bank()
+    labels = [(name, number) for name in bank for number in range(1, len(bank[name]) + 1)]
+    questions = [question for name in bank for question in bank[name]]
+    start = time.perf_counter()
+    clusters = find_clusters(questions)
+    elapsed = (time.perf_counter() - start) * 1000
+    groups = {}
+    for i, label in enumerate(clusters):
+        groups.setdefault(label, []).append(i)
+    duplicates = [members for members in groups.values() if len(members) > 1]
+    print(f"{len(questions)} questions, {len(groups)} unique, {len(duplicates)} duplicate clusters "
+          f"({elapsed:.0f} ms)")
+    for members in duplicates:
+        print(" | ".join("{} #{}".format(*labels[i]) for i in members))
+
+
+if __name__ == "__main__":
+    main()
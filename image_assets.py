@@ -0,0 +1,321 @@
+import base64
+import hashlib
+import mimetypes
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+# Base directory for pictures: Pictures/<sheet name>/<file>
+PICTURES_DIR = "Pictures"
+
+# File name prefixes tried for every image, in priority order
+FILE_PREFIXES = ["Question ", "Question", "Q", "Picture", ""]
+
+# Name stems per image role, in priority order ({n} is the question number)
+ROLE_STEMS = {
+    "question": ["{n}"],
+    "answer": ["{n}_answer", "Answer{n}", "Picture{n}"],
+}
+
+# How often (seconds) lookups re-check directory mtimes for new files
+REFRESH_INTERVAL = 5.0
+
+# Upper bound on encoded data URIs kept in memory
+IMAGE_CACHE_BYTES = 32 * 1024 * 1024
+
+# Streamlit serves ./static at app/static when server.enableStaticServing is on
+STATIC_DIR = "static"
+STATIC_IMAGE_DIR = os.path.join(STATIC_DIR, "img")
+STATIC_URL_PREFIX = "app/static/img/"
+
+# Display-width buckets for optimized variants; images are never upscaled
+VARIANT_WIDTHS = (480, 768, 1200)
+VARIANT_FORMAT = "WEBP"
+VARIANT_QUALITY = 85
+# Bucket used when images are sent inline (the question column of the wide layout)
+INLINE_WIDTH = 768
+
+
+def _compile_patterns():
+    """
+    Turn every (role, stem, prefix) combination into a regex, ranked by the
+    order the quiz used to probe them with os.path.exists.
+    """
+    patterns = []
+    for role, stems in ROLE_STEMS.items():
+        rank = 0
+        for stem in stems:
+            for prefix in FILE_PREFIXES:
+                name = re.escape(prefix) + re.escape(stem).replace(r"\{n\}", r"(?P<n>\d+)") + r"\.png"
+                patterns.append((role, rank, re.compile(name)))
+                rank += 1
+    return patterns
+
+
+PATTERNS = _compile_patterns()
+
+
+class ImageIndex:
+    """
+    In-memory map of (sheet, question number, role) -> image path, built by
+    scanning the Pictures tree once. Lookups are dictionary hits; directory
+    mtimes are re-checked at most every REFRESH_INTERVAL seconds.
+    """
+
+    def __init__(self, base_dir=PICTURES_DIR, refresh_interval=REFRESH_INTERVAL):
+        self.base_dir = base_dir
+        self.refresh_interval = refresh_interval
+        self._entries = {}
+        self._mtimes = {}
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        # Bumped on every rebuild, so caches of lookups can tell they are stale
+        self.version = 0
+        self.rebuild()
+
+    def _dir_mtimes(self):
+        mtimes = {}
+        try:
+            mtimes[self.base_dir] = os.stat(self.base_dir).st_mtime_ns
+            with os.scandir(self.base_dir) as it:
+                for entry in it:
+                    if entry.is_dir():
+                        mtimes[entry.path] = entry.stat().st_mtime_ns
+        except FileNotFoundError:
+            pass
+        return mtimes
+
+    def rebuild(self):
+        """Scan the Pictures tree and replace the index"""
+        entries = {}
+        ranks = {}
+        mtimes = self._dir_mtimes()
+        for sheet_dir in mtimes:
+            if sheet_dir == self.base_dir:
+                continue
+            sheet_name = os.path.basename(sheet_dir)
+            for filename in os.listdir(sheet_dir):
+                for role, rank, pattern in PATTERNS:
+                    match = pattern.fullmatch(filename)
+                    if not match:
+                        continue
+                    key = (sheet_name, match.group("n"), role)
+                    if rank < ranks.get(key, len(PATTERNS)):
+                        ranks[key] = rank
+                        entries[key] = os.path.join(sheet_dir, filename)
+        with self._lock:
+            self._entries = entries
+            self._mtimes = mtimes
+            self._next_check = time.monotonic() + self.refresh_interval
+            self.version += 1
+
+    def _maybe_refresh(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        with self._lock:
+            if now < self._next_check:
+                return
+            self._next_check = now + self.refresh_interval
+        if self._dir_mtimes() != self._mtimes:
+            self.rebuild()
+
+    def current_version(self):
+        """The index version, after picking up any changes to the Pictures tree"""
+        self._maybe_refresh()
+        return self.version
+
+    def lookup(self, sheet_name, question_number, role="question"):
+        """Path of the image for a question, or None"""
+        self._maybe_refresh()
+        return self._entries.get((sheet_name, str(question_number), role))
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ImageCache:
+    """
+    Byte-bounded LRU of base64 data URIs keyed by (path, mtime), plus the
+    content-addressed static copies used when static serving is enabled.
+    """
+
+    def __init__(self, max_bytes=IMAGE_CACHE_BYTES, static_dir=STATIC_IMAGE_DIR):
+        self.max_bytes = max_bytes
+        self.static_dir = static_dir
+        self.size = 0
+        self._uris = OrderedDict()
+        self._static_urls = {}
+        self._hashes = {}
+        self._variants = {}
+        self._lock = threading.Lock()
+
+    def data_uri(self, path):
+        """Image as a data URI, encoded at most once per file version"""
+        key = (path, os.stat(path).st_mtime_ns)
+        with self._lock:
+            uri = self._uris.get(key)
+            if uri is not None:
+                self._uris.move_to_end(key)
+                return uri
+        with open(path, "rb") as f:
+            img_b64 = base64.b64encode(f.read()).decode()
+        mime = mimetypes.guess_type(path)[0] or "image/png"
+        uri = f"data:{mime};base64,{img_b64}"
+        with self._lock:
+            if key not in self._uris and len(uri) <= self.max_bytes:
+                self._uris[key] = uri
+                self.size += len(uri)
+                while self.size > self.max_bytes:
+                    _, evicted = self._uris.popitem(last=False)
+                    self.size -= len(evicted)
+        return uri
+
+    def _source_hash(self, path):
+        key = (path, os.stat(path).st_mtime_ns)
+        content_hash = self._hashes.get(key)
+        if content_hash is None:
+            with open(path, "rb") as f:
+                content_hash = hashlib.sha256(f.read()).hexdigest()[:16]
+            with self._lock:
+                self._hashes[key] = content_hash
+        return content_hash
+
+    def variants(self, path):
+        """
+        Optimized variants of an image as a list of (width, file path), smallest
+        first. Missing variants are generated on first use.
+        """
+        content_hash = self._source_hash(path)
+        result = self._variants.get(content_hash)
+        if result is None:
+            result = build_variants(path, self.static_dir, content_hash)
+            with self._lock:
+                self._variants[content_hash] = result
+        return result
+
+    def static_url(self, path):
+        """
+        URL of a copy of the image named after its content hash, so browsers
+        can cache it and reruns only send the URL.
+        """
+        key = (path, os.stat(path).st_mtime_ns)
+        url = self._static_urls.get(key)
+        if url is not None:
+            return url
+        filename = self._source_hash(path) + os.path.splitext(path)[1].lower()
+        target = os.path.join(self.static_dir, filename)
+        if not os.path.exists(target):
+            os.makedirs(self.static_dir, exist_ok=True)
+            staging = f"{target}.tmp{os.getpid()}.{threading.get_ident()}"
+            shutil.copyfile(path, staging)
+            os.replace(staging, target)
+        url = STATIC_URL_PREFIX + filename
+        with self._lock:
+            self._static_urls[key] = url
+        return url
+
+
+def variant_filename(content_hash, width):
+    return f"{content_hash}-{width}w.{VARIANT_FORMAT.lower()}"
+
+
+def build_variants(path, out_dir=STATIC_IMAGE_DIR, content_hash=None):
+    """
+    Write resized, re-encoded copies of an image for each width bucket below
+    its own width (plus one at full width) and return [(width, path), ...].
+    Files are named after the source's content hash, so existing variants
+    are reused until the source changes.
+    """
+    # PIL is only needed when variants are built, not to look images up
+    from PIL import Image
+
+    if content_hash is None:
+        with open(path, "rb") as f:
+            content_hash = hashlib.sha256(f.read()).hexdigest()[:16]
+    with Image.open(path) as img:
+        widths = [width for width in VARIANT_WIDTHS if width < img.width] + [img.width]
+        targets = [(width, os.path.join(out_dir, variant_filename(content_hash, width))) for width in widths]
+        missing = [(width, target) for width, target in targets if not os.path.exists(target)]
+        if missing:
+            os.makedirs(out_dir, exist_ok=True)
+            img.load()
+            for width, target in missing:
+                height = max(1, round(img.height * width / img.width))
+                resized = img if width == img.width else img.resize((width, height), Image.LANCZOS)
+                staging = f"{target}.tmp{os.getpid()}.{threading.get_ident()}"
+                resized.save(staging, VARIANT_FORMAT, quality=VARIANT_QUALITY, method=6)
+                os.replace(staging, target)
+    return targets
+
+
+def pick_variant(variants, width):
+    """
+    Smallest variant at least `width` wide, or the largest one. A width of
+    None (the original file, when no variants could be made) always fits.
+    """
+    for variant_width, path in variants:
+        if variant_width is None or variant_width >= width:
+            return path
+    return variants[-1][1]
+
+
+def optimize_pictures(base_dir=PICTURES_DIR, out_dir=STATIC_IMAGE_DIR):
+    """
+    Build step: generate variants for every image under the Pictures tree and
+    delete variants whose source no longer exists. Returns the number of
+    source images processed.
+    """
+    current = set()
+    count = 0
+    for sheet_dir, _, filenames in os.walk(base_dir):
+        for filename in filenames:
+            if not filename.lower().endswith(".png"):
+                continue
+            for _, target in build_variants(os.path.join(sheet_dir, filename), out_dir):
+                current.add(os.path.basename(target))
+            count += 1
+    suffix = "w." + VARIANT_FORMAT.lower()
+    if os.path.isdir(out_dir):
+        for filename in os.listdir(out_dir):
+            if filename.endswith(suffix) and filename not in current:
+                os.remove(os.path.join(out_dir, filename))
+    return count
+
+
+def _benchmark(sheet_dir=os.path.join(PICTURES_DIR, "25 Q1 2023"), rounds=50):
+    """Bytes sent per rerun and encode time, inline vs cached vs static"""
+    paths = sorted(os.path.join(sheet_dir, name) for name in os.listdir(sheet_dir))
+    print(f"{'image':<22}{'file':>10}{'inline':>10}{'static':>8}{'encode':>11}{'cached':>10}")
+    for path in paths:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            with open(path, "rb") as f:
+                uri = "data:image/png;base64," + base64.b64encode(f.read()).decode()
+        encode = (time.perf_counter() - start) / rounds
+        cache = ImageCache(static_dir=os.path.join(STATIC_IMAGE_DIR, ".bench"))
+        cache.data_uri(path)
+        start = time.perf_counter()
+        for _ in range(rounds):
+            cache.data_uri(path)
+        cached = (time.perf_counter() - start) / rounds
+        url = cache.static_url(path)
+        print(f"{os.path.basename(path):<22}{os.path.getsize(path):>10}{len(uri):>10}{len(url):>8}"
+              f"{encode * 1e3:>9.3f}ms{cached * 1e6:>8.1f}us")
+        sizes = ", ".join(f"{width}w {os.path.getsize(variant)}" for width, variant in cache.variants(path))
+        print(f"{'':<22}variants: {sizes}")
+    shutil.rmtree(os.path.join(STATIC_IMAGE_DIR, ".bench"), ignore_errors=True)
+
+
+if __name__ == "__main__":
+    # python image_assets.py --optimize      -> build display-sized variants
+    # python image_assets.py --bench [dir]   -> bytes per rerun and encode time
+    if "--bench" in sys.argv:
+        args = [arg for arg in sys.argv[1:] if arg != "--bench"]
+        _benchmark(*args)
+    elif "--optimize" in sys.argv:
+        print(f"Optimized {optimize_pictures()} images into {STATIC_IMAGE_DIR}")
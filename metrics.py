@@ -0,0 +1,238 @@
+"""
+Opt-in per-rerun instrumentation for the quiz app.
+
+Enable with environment variables (both may be set):
+    QUIZ_METRICS_LOG=metrics.jsonl   one JSON line per rerun, rotated at 10 MB
+    QUIZ_METRICS_PORT=9108           Prometheus text format at :9108/metrics
+
+When neither is set, timed() returns functions unchanged and stage() is a
+shared no-op context manager, so the instrumentation costs nothing.
+"""
+import bisect
+import contextlib
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LOG_PATH = os.environ.get("QUIZ_METRICS_LOG")
+PORT = os.environ.get("QUIZ_METRICS_PORT")
+ENABLED = bool(LOG_PATH or PORT)
+
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUPS = 5
+
+# Upper bounds (seconds) of the rerun latency histogram
+RERUN_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_local = threading.local()
+_lock = threading.Lock()
+_stage_totals = {}      # stage -> [count, seconds]
+_rerun_counts = [0] * (len(RERUN_BUCKETS) + 1)
+_rerun_sum = 0.0
+_reruns = 0
+_session_count = 0
+_logger = None
+_server = None
+_started = False
+_NOOP = contextlib.nullcontext()
+
+
+def _new_record():
+    record = _local.record = {"start": time.perf_counter(), "stages": {}, "stack": [], "script": False}
+    return record
+
+
+def _record():
+    """The current thread's in-progress rerun record, created on first use"""
+    record = getattr(_local, "record", None)
+    if record is None:
+        record = _new_record()
+    return record
+
+
+def begin_rerun():
+    """
+    Mark the start of the script body. The record opened by this rerun's
+    callbacks (they run before the script) is kept; one left by a rerun that
+    was cut short before end_rerun(), e.g. by a RerunException, is dropped,
+    so its stages are not counted again.
+    """
+    if not ENABLED:
+        return
+    record = getattr(_local, "record", None)
+    if record is None or record["script"]:
+        record = _new_record()
+    record["script"] = True
+
+
+def _enter():
+    _record()["stack"].append(0.0)
+    return time.perf_counter()
+
+
+def _exit(name, start):
+    """
+    Add a stage's self time: time spent in stages nested inside it (e.g.
+    load_data inside a callback) is attributed to the inner stage only.
+    """
+    elapsed = time.perf_counter() - start
+    record = _record()
+    stack = record["stack"]
+    children = stack.pop() if stack else 0.0
+    if stack:
+        stack[-1] += elapsed
+    stages = record["stages"]
+    stages[name] = stages.get(name, 0.0) + elapsed - children
+
+
+def timed(name, callback=False):
+    """
+    Decorator that adds the function's run time to stage `name`. Pass
+    callback=True for widget callbacks: they run before the script body, so
+    a record whose body already started there is left by a rerun that was
+    cut short and is dropped.
+    """
+    def decorate(func):
+        if not ENABLED:
+            return func
+
+        def wrapper(*args, **kwargs):
+            if callback and getattr(_local, "record", None) is not None and _local.record["script"]:
+                _new_record()
+            start = _enter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _exit(name, start)
+
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+    return decorate
+
+
+@contextlib.contextmanager
+def _timed_block(name):
+    start = _enter()
+    try:
+        yield
+    finally:
+        _exit(name, start)
+
+
+def stage(name):
+    """Context manager that adds the block's run time to stage `name`"""
+    if not ENABLED:
+        return _NOOP
+    return _timed_block(name)
+
+
+def end_rerun(session_id, rerun_number, page):
+    """
+    Close the current thread's rerun record (callbacks that ran before the
+    script are included), update the aggregates and write the log line.
+    Time not attributed to a stage is reported as "render". A session is
+    counted at its first rerun.
+    """
+    if not ENABLED:
+        return
+    global _rerun_sum, _reruns, _session_count
+    record = _record()
+    _local.record = None
+    total = time.perf_counter() - record["start"]
+    stages = record["stages"]
+    stages["render"] = max(0.0, total - sum(stages.values()))
+
+    with _lock:
+        _reruns += 1
+        _rerun_sum += total
+        _rerun_counts[bisect.bisect_left(RERUN_BUCKETS, total)] += 1
+        _session_count += rerun_number == 1
+        for name, seconds in stages.items():
+            totals = _stage_totals.setdefault(name, [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+
+    if _logger is not None:
+        _logger.info(json.dumps({
+            "ts": round(time.time(), 3),
+            "session": session_id,
+            "rerun": rerun_number,
+            "page": page,
+            "total_ms": round(total * 1000, 3),
+            "stages_ms": {name: round(seconds * 1000, 3) for name, seconds in stages.items()},
+        }))
+
+
+def render_prometheus():
+    """Current aggregates in the Prometheus text exposition format"""
+    with _lock:
+        lines = [
+            "# HELP quiz_reruns_total Script reruns across all sessions.",
+            "# TYPE quiz_reruns_total counter",
+            f"quiz_reruns_total {_reruns}",
+            "# HELP quiz_sessions_total Sessions whose first rerun ran in this process.",
+            "# TYPE quiz_sessions_total counter",
+            f"quiz_sessions_total {_session_count}",
+            "# HELP quiz_rerun_seconds Wall time per rerun, including callbacks.",
+            "# TYPE quiz_rerun_seconds histogram",
+        ]
+        cumulative = 0
+        for bound, count in zip(RERUN_BUCKETS, _rerun_counts):
+            cumulative += count
+            lines.append(f'quiz_rerun_seconds_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'quiz_rerun_seconds_bucket{{le="+Inf"}} {_reruns}')
+        lines.append(f"quiz_rerun_seconds_sum {_rerun_sum:.6f}")
+        lines.append(f"quiz_rerun_seconds_count {_reruns}")
+        lines.append("# HELP quiz_stage_seconds Time per rerun stage.")
+        lines.append("# TYPE quiz_stage_seconds summary")
+        for name, (count, seconds) in sorted(_stage_totals.items()):
+            lines.append(f'quiz_stage_seconds_sum{{stage="{name}"}} {seconds:.6f}')
+            lines.append(f'quiz_stage_seconds_count{{stage="{name}"}} {count}')
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start():
+    """Open the log and start the endpoint once per process (safe to call every rerun)"""
+    global _logger, _server, _started
+    if not ENABLED or _started:
+        return
+    with _lock:
+        if _started:
+            return
+        _started = True
+        if LOG_PATH:
+            handler = logging.handlers.RotatingFileHandler(LOG_PATH, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            _logger = logging.getLogger("quiz.metrics")
+            _logger.setLevel(logging.INFO)
+            _logger.propagate = False
+            _logger.addHandler(handler)
+        if PORT:
+            try:
+                _server = ThreadingHTTPServer(("", int(PORT)), _MetricsHandler)
+            except OSError as e:
+                # Another worker on this host already owns the port
+                logging.getLogger(__name__).warning("Metrics endpoint not started: %s", e)
+            else:
+                threading.Thread(target=_server.serve_forever, name="quiz-metrics", daemon=True).start()
@@ -0,0 +1,107 @@
+"""
+Background preparation of the questions a candidate is about to see.
+
+While question k is on screen, a small thread pool decodes the questions at
+the neighbouring positions, looks up their images and builds the image
+variants and data URIs they need. When Next or Previous reruns the page,
+the render data is a dictionary hit and the images are already in the
+shared ImageCache, so nothing is read or encoded on the rerun itself.
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from image_assets import INLINE_WIDTH, pick_variant
+
+# Image work is mostly file IO and PIL, which release the GIL
+PREFETCH_WORKERS = 2
+# Worker threads are named THREAD_NAME_0, THREAD_NAME_1, ...
+THREAD_NAME = "prefetch"
+# Render data kept for all sessions; one entry per bank version, image index
+# version, test and question
+RENDER_CACHE_SIZE = 512
+
+
+class RenderData:
+    """Everything the quiz page needs to draw one question"""
+
+    __slots__ = ("question", "image_sheet", "question_num", "image_path", "answer_image_path")
+
+    def __init__(self, question, image_sheet, question_num, image_path, answer_image_path):
+        self.question = question
+        self.image_sheet = image_sheet
+        self.question_num = question_num
+        self.image_path = image_path
+        self.answer_image_path = answer_image_path
+
+
+class Prefetcher:
+    """
+    LRU of RenderData shared by all sessions, filled on demand by the page
+    and ahead of time by prefetch(). A request for a question that is still
+    being prefetched waits for that work instead of repeating it.
+    """
+
+    def __init__(self, image_index, image_cache, workers=PREFETCH_WORKERS, max_entries=RENDER_CACHE_SIZE):
+        self.image_index = image_index
+        self.image_cache = image_cache
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=THREAD_NAME)
+
+    def _key(self, bank, test_name, question_index):
+        # A reloaded bank or a changed Pictures folder makes older entries unreachable
+        return (bank.sha256, self.image_index.current_version(), test_name, question_index)
+
+    def render_data(self, bank, test_name, question_index, static_serving=False):
+        """RenderData for a question index of a test, built now if it was not prefetched"""
+        key = self._key(bank, test_name, question_index)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+            future = self._pending.get(key)
+        if future is not None:
+            return future.result()
+        return self._build(bank, key, static_serving)
+
+    def prefetch(self, bank, test_name, question_index, static_serving=False):
+        """Prepare a question in the background (no-op if it is ready or under way)"""
+        key = self._key(bank, test_name, question_index)
+        with self._lock:
+            if key in self._entries or key in self._pending:
+                return
+            self._pending[key] = self._executor.submit(self._build, bank, key, static_serving)
+
+    def _build(self, bank, key, static_serving):
+        _, _, test_name, question_index = key
+        try:
+            question = bank.questions(test_name)[question_index]
+            image_sheet, question_num = bank.source(test_name, question_index)
+            image_path = self.image_index.lookup(image_sheet, question_num)
+            answer_image_path = self.image_index.lookup(image_sheet, question_num, "answer")
+            for path in (image_path, answer_image_path):
+                if path:
+                    self._warm_image(path, static_serving)
+            entry = RenderData(question, image_sheet, question_num, image_path, answer_image_path)
+            with self._lock:
+                self._entries[key] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return entry
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def _warm_image(self, path, static_serving):
+        # Same calls as show_image, so its rerun only hits the cache
+        try:
+            variants = self.image_cache.variants(path)
+            if not static_serving:
+                self.image_cache.data_uri(pick_variant(variants, INLINE_WIDTH))
+        except Exception:
+            # show_image reports the problem when the question is drawn
+            pass
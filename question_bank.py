@@ -0,0 +1,894 @@
+import bisect
+import hashlib
+import json
+import logging
+import math
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Mapping, Sequence
+
+from workbooks import BANK_DIR, discover_workbooks, display_name, sheet_fingerprints, workbook_stamps
+
+# Sheets are discovered in the workbooks of BANK_DIR (see workbooks.py); a
+# sheet is offered as a test when its header row has these columns
+REQUIRED_COLUMNS = ("Question", "Key")
+# Name of the "every sheet" pool offered by the adaptive mode. The Test sheet
+# repeats questions from 25 Q1 2023, so it is left out of the pool.
+POOLED_TEST = "All sheets"
+POOL_EXCLUDE = ("Test",)
+
+# Compiled snapshots live here, one directory per bank version (a hash of
+# every sheet's fingerprint). Compiled sheets are cached by fingerprint in
+# SHEET_CACHE_DIR and shared between versions.
+SNAPSHOT_DIR = ".bank_cache"
+SHEET_CACHE_DIR = "sheets"
+MANIFEST_NAME = "manifest.json"
+BANK_FILE_NAME = "questions.bin"
+# Bumped whenever the snapshot layout changes, so old snapshots are rebuilt
+SNAPSHOT_FORMAT = 5
+# Versions kept on disk and in memory for sessions that started on them
+KEEP_VERSIONS = 3
+# A version a session used within this many seconds is kept as well, however
+# many reloads happened since: longer than the longest exam (230 minutes)
+VERSION_LEASE = 6 * 3600
+# Using a version renews its lease (the snapshot directory's mtime, so every
+# worker sharing the snapshot directory sees it) at most this often
+LEASE_RENEW_INTERVAL = 60
+# Cached sheets unused by the kept snapshots are removed once older than this
+# (seconds), so a worker never deletes sheets another one is compiling into a
+# newer snapshot
+SHEET_GRACE = 3600
+# How often (seconds) the watcher checks the workbooks for changes
+POLL_INTERVAL = 2.0
+# Row problems kept per sheet for the report (the total is always counted)
+MAX_REPORTED_ERRORS = 1000
+# Strings up to this many bytes are stored once per sheet; the intern table
+# is capped so memory stays bounded however long the sheet is
+INTERN_MAX_LENGTH = 64
+INTERN_LIMIT = 4096
+
+# questions.bin layout:
+#   header     magic, format, length of the JSON directory that follows
+#   directory  {"sheets": {name: [offset, count, heap offset]}}, with
+#              offsets relative to the start of the data region
+#   data       per sheet: one fixed-size RECORD per question, then that
+#              sheet's heap of UTF-8 strings referenced from its records as
+#              (offset, length)
+# Each sheet is compiled on its own into a segment file (SEGMENT_HEADER,
+# records, heap) and the bank file is the segments concatenated.
+BANK_MAGIC = b"QBNK"
+BANK_HEADER = struct.Struct("<4sII")
+SEGMENT_MAGIC = b"QSEG"
+# magic, format, number of records
+SEGMENT_HEADER = struct.Struct("<4sII")
+# number, answer mask, multi flag, present-options mask, then (offset, length)
+# for the question text, options A-E and the explanation
+RECORD = struct.Struct("<IBBBx" + "II" * 7)
+NO_STRING = 0xFFFFFFFF
+
+# Answer letters in column order; bit i of an answer mask is OPTION_KEYS[i]
+OPTION_KEYS = ("A", "B", "C", "D", "E")
+
+
+class Question:
+    """
+    Immutable, pre-parsed question record. Options keep their letters so that
+    answers can be compared as bitmasks instead of re-reading the sheet row.
+    """
+
+    __slots__ = ("number", "text", "options", "keys", "answer_mask", "multi", "explanation")
+
+    def __init__(self, number, text, options, keys, answer_mask, multi, explanation):
+        for name, value in zip(self.__slots__, (number, text, options, keys, answer_mask, multi, explanation)):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Question records are read-only")
+
+    def __reduce__(self):
+        return (Question, tuple(getattr(self, name) for name in self.__slots__))
+
+    def __repr__(self):
+        return f"Question({self.number}, keys={self.correct_keys()})"
+
+    def correct_keys(self):
+        """Letters of the correct answer(s), in A-E order"""
+        return [key for i, key in enumerate(OPTION_KEYS) if self.answer_mask >> i & 1]
+
+    def option_text(self, key):
+        """Text of the option with the given letter, or None if it is missing"""
+        if key in self.keys:
+            return self.options[self.keys.index(key)]
+        return None
+
+    def selection_mask(self, selections):
+        """Bitmask of the option letters behind the selected option texts"""
+        mask = 0
+        for selection in selections:
+            if selection in self.options:
+                mask |= 1 << OPTION_KEYS.index(self.keys[self.options.index(selection)])
+        return mask
+
+    def options_for_mask(self, mask):
+        """Option texts whose letters are set in mask, in A-E order"""
+        return [option for key, option in zip(self.keys, self.options) if mask >> OPTION_KEYS.index(key) & 1]
+
+
+QUIZ_COLUMNS = ("Question", "Key") + tuple(f"Option {key}" for key in OPTION_KEYS) + ("Feedback", "Explanation")
+
+
+def _missing(value):
+    # Empty cells come back as None from openpyxl and NaN from pandas
+    return value is None or (isinstance(value, float) and math.isnan(value)) or value == ""
+
+
+def _parse_answer_mask(key):
+    mask = 0
+    for part in str(key).split(","):
+        part = part.strip()
+        if part in OPTION_KEYS:
+            mask |= 1 << OPTION_KEYS.index(part)
+    return mask
+
+
+def normalize_row(number, row, errors=None):
+    """
+    Build the Question for one data row ({column: cell value}; absent
+    columns count as empty). Problems that would otherwise only show up at
+    render time are appended to errors as {"row", "column", "message"},
+    with row being the spreadsheet row (the header is row 1).
+    """
+    def problem(column, message):
+        if errors is not None:
+            errors.append({"row": number + 1, "column": column, "message": message})
+
+    keys = []
+    options = []
+    for key in OPTION_KEYS:
+        value = row.get(f"Option {key}")
+        if not _missing(value):
+            keys.append(key)
+            options.append(str(value))
+    explanation = None
+    # Feedback first, Explanation as a fallback (per row, as before)
+    for col in ("Feedback", "Explanation"):
+        if not _missing(row.get(col)):
+            explanation = str(row[col])
+            break
+
+    text = row.get("Question")
+    if _missing(text):
+        text = ""
+        problem("Question", "Question is empty")
+    key = row.get("Key")
+    if _missing(key):
+        key = ""
+        problem("Key", "Key is empty")
+    else:
+        for part in str(key).split(","):
+            part = part.strip()
+            if part not in OPTION_KEYS:
+                problem("Key", f"Key {str(key)!r}: {part!r} is not an option letter")
+            elif part not in keys:
+                problem("Key", f"Key refers to Option {part}, which is empty")
+    return Question(
+        number=number,
+        text=str(text),
+        options=tuple(options),
+        keys=tuple(keys),
+        answer_mask=_parse_answer_mask(key),
+        multi="," in str(key),
+        explanation=explanation,
+    )
+
+
+def is_question_sheet(columns):
+    return all(column in columns for column in REQUIRED_COLUMNS)
+
+
+def sheet_rows(workbook, sheet):
+    """
+    Stream a sheet's data rows, one {column: value} dict at a time, from a
+    workbook opened with load_workbook(read_only=True); only QUIZ_COLUMNS
+    are kept. Returns None if the sheet is not a question sheet. Blank rows
+    inside the sheet are kept (question numbers follow row positions) and
+    trailing ones are dropped.
+    """
+    rows = workbook[sheet].iter_rows(values_only=True)
+    header = next(rows, ())
+    columns = {}
+    for i, name in enumerate(header):
+        if name in QUIZ_COLUMNS and name not in columns:
+            columns[name] = i
+    if not is_question_sheet(columns):
+        return None
+
+    def data_rows():
+        blank = 0
+        for cells in rows:
+            row = {name: cells[i] for name, i in columns.items() if i < len(cells) and not _missing(cells[i])}
+            if not row:
+                # Only a counter, so a long blank tail costs nothing
+                blank += 1
+                continue
+            for _ in range(blank):
+                yield {}
+            blank = 0
+            yield row
+
+    return data_rows()
+
+
+def list_sources(bank_dir=BANK_DIR, workbooks=None):
+    """
+    Every sheet of every workbook as (display name, workbook path, sheet name,
+    fingerprint). Pass workbooks as {path: fingerprints} to reuse fingerprints.
+    """
+    if workbooks is None:
+        workbooks = {}
+        for path in discover_workbooks(bank_dir):
+            try:
+                workbooks[path] = sheet_fingerprints(path)
+            except ValueError as e:
+                logging.getLogger(__name__).warning("Skipping workbook: %s", e)
+    return [
+        (display_name(path, sheet), path, sheet, fingerprint)
+        for path, fingerprints in workbooks.items()
+        for sheet, fingerprint in fingerprints
+    ]
+
+
+def bank_version(sources):
+    """Version hash of a bank: changes when any sheet is added, removed or edited"""
+    key = json.dumps([(name, fingerprint) for name, _, _, fingerprint in sources])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def snapshot_path(content_hash, snapshot_dir=SNAPSHOT_DIR):
+    return os.path.join(snapshot_dir, f"{content_hash[:16]}-v{SNAPSHOT_FORMAT}")
+
+
+class SegmentWriter:
+    """
+    Compiles one sheet's questions into a segment file as they stream in.
+    Records and strings are spooled to temporary files, so memory use does
+    not grow with the sheet; only short strings are interned.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._records = tempfile.TemporaryFile()
+        self._heap = tempfile.TemporaryFile()
+        self._heap_size = 0
+        self._strings = {}
+
+    def _ref(self, value):
+        if value is None:
+            return (NO_STRING, 0)
+        data = value.encode("utf-8")
+        if len(data) <= INTERN_MAX_LENGTH and data in self._strings:
+            return (self._strings[data], len(data))
+        offset = self._heap_size
+        self._heap.write(data)
+        self._heap_size += len(data)
+        if len(data) <= INTERN_MAX_LENGTH and len(self._strings) < INTERN_LIMIT:
+            self._strings[data] = offset
+        return (offset, len(data))
+
+    def add(self, question):
+        present = 0
+        option_refs = []
+        for i, key in enumerate(OPTION_KEYS):
+            option = question.option_text(key)
+            if option is not None:
+                present |= 1 << i
+            option_refs.extend(self._ref(option))
+        self._records.write(RECORD.pack(
+            question.number, question.answer_mask, question.multi, present,
+            *self._ref(question.text), *option_refs, *self._ref(question.explanation),
+        ))
+        self.count += 1
+
+    def close(self):
+        """Write the segment file (atomically) and release the spool files"""
+        staging = f"{self.path}.tmp{os.getpid()}"
+        with open(staging, "wb") as f:
+            f.write(SEGMENT_HEADER.pack(SEGMENT_MAGIC, SNAPSHOT_FORMAT, self.count))
+            for spool in (self._records, self._heap):
+                spool.seek(0)
+                shutil.copyfileobj(spool, f)
+                spool.close()
+        os.replace(staging, self.path)
+
+
+def write_bank_file(path, segments):
+    """
+    Concatenate compiled sheet segments ([(name, segment path)]) into the
+    layout that QuestionBank memory-maps, copying them in chunks.
+    """
+    directory = {"sheets": {}}
+    offset = 0
+    for name, segment in segments:
+        with open(segment, "rb") as f:
+            magic, version, count = SEGMENT_HEADER.unpack(f.read(SEGMENT_HEADER.size))
+        if magic != SEGMENT_MAGIC or version != SNAPSHOT_FORMAT:
+            raise ValueError(f"{segment} is not a format {SNAPSHOT_FORMAT} sheet segment")
+        directory["sheets"][name] = [offset, count, offset + count * RECORD.size]
+        offset += os.path.getsize(segment) - SEGMENT_HEADER.size
+    data = json.dumps(directory).encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(BANK_HEADER.pack(BANK_MAGIC, SNAPSHOT_FORMAT, len(data)))
+        f.write(data)
+        for _, segment in segments:
+            with open(segment, "rb") as source:
+                source.seek(SEGMENT_HEADER.size)
+                shutil.copyfileobj(source, f)
+
+
+def map_bank_file(path):
+    """(mmap, {name: MappedSheet}) for a bank file written by write_bank_file"""
+    with open(path, "rb") as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, directory_size = BANK_HEADER.unpack_from(buf, 0)
+    if magic != BANK_MAGIC or version != SNAPSHOT_FORMAT:
+        buf.close()
+        raise ValueError(f"{path} is not a format {SNAPSHOT_FORMAT} question bank")
+    directory = json.loads(bytes(buf[BANK_HEADER.size:BANK_HEADER.size + directory_size]))
+    data = BANK_HEADER.size + directory_size
+    sheets = {
+        name: MappedSheet(buf, data + offset, count, data + heap)
+        for name, (offset, count, heap) in directory["sheets"].items()
+    }
+    return buf, sheets
+
+
+def cluster_sheets(questions_by_sheet):
+    """
+    Near-duplicate cluster labels ({name: [label, ...]}) across all sheets;
+    equal labels mark the same question reworded (see dedup.py).
+    """
+    from dedup import find_clusters
+
+    labels = find_clusters(
+        (question for questions in questions_by_sheet.values() for question in questions),
+        sum(len(questions) for questions in questions_by_sheet.values()),
+    )
+    clusters = {}
+    start = 0
+    for name, questions in questions_by_sheet.items():
+        clusters[name] = labels[start:start + len(questions)]
+        start += len(questions)
+    return clusters
+
+
+def _cached_sheet(sheet_dir, fingerprint, suffix=".seg"):
+    return os.path.join(sheet_dir, fingerprint[:32] + suffix)
+
+
+def compile_changed_sheets(sources, sheet_dir):
+    """
+    Compile only the sheets whose fingerprint is not cached yet. Rows are
+    streamed from each workbook (openpyxl read-only mode, one pass per sheet)
+    straight into a segment file, with row problems written to a ".json"
+    report next to it; other sheets get an empty ".skip" marker.
+    Returns {name: number of row problems} for the sheets compiled.
+    """
+    missing = {}
+    for name, path, sheet, fingerprint in sources:
+        if not (os.path.exists(_cached_sheet(sheet_dir, fingerprint))
+                or os.path.exists(_cached_sheet(sheet_dir, fingerprint, ".skip"))):
+            missing.setdefault(path, []).append((name, sheet, fingerprint))
+    if not missing:
+        return {}
+    # Imported here so opening an up-to-date snapshot never loads openpyxl
+    from openpyxl import load_workbook
+
+    compiled = {}
+    for path, sheets in missing.items():
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            for name, sheet, fingerprint in sheets:
+                rows = sheet_rows(workbook, sheet)
+                if rows is None:
+                    open(_cached_sheet(sheet_dir, fingerprint, ".skip"), "w").close()
+                    continue
+                writer = SegmentWriter(_cached_sheet(sheet_dir, fingerprint))
+                errors = []
+                total = 0
+                for number, row in enumerate(rows, start=1):
+                    problems = []
+                    writer.add(normalize_row(number, row, problems))
+                    total += len(problems)
+                    errors.extend(problems[:MAX_REPORTED_ERRORS - len(errors)])
+                # The report goes first: a segment without one is never seen
+                report = _cached_sheet(sheet_dir, fingerprint, ".json")
+                staging = f"{report}.tmp{os.getpid()}"
+                with open(staging, "w") as f:
+                    json.dump({"total": total, "rows": errors}, f)
+                os.replace(staging, report)
+                writer.close()
+                compiled[name] = total
+        finally:
+            workbook.close()
+    return compiled
+
+
+def compile_snapshot(sources=None, snapshot_dir=SNAPSHOT_DIR):
+    """
+    Builds the snapshot for the current bank version: compiles only changed
+    sheets, then joins the sheet segments into the bank file and writes a
+    manifest (with row problems and near-duplicate clusters) into a directory
+    named after the version. Returns the snapshot directory.
+    """
+    if sources is None:
+        sources = list_sources()
+    version = bank_version(sources)
+    target = snapshot_path(version, snapshot_dir)
+    if os.path.exists(os.path.join(target, MANIFEST_NAME)):
+        return target
+
+    sheet_dir = os.path.join(snapshot_dir, SHEET_CACHE_DIR)
+    os.makedirs(sheet_dir, exist_ok=True)
+    for name, total in compile_changed_sheets(sources, sheet_dir).items():
+        if total:
+            logging.getLogger(__name__).warning(
+                "%s: %d row problem(s); run python question_bank.py --validate", name, total)
+
+    manifest = {
+        "sha256": version,
+        "workbooks": sorted({os.path.basename(path) for _, path, _, _ in sources}),
+        "fingerprints": [fingerprint for _, _, _, fingerprint in sources],
+        "sources": {},
+        "errors": {},
+    }
+    segments = []
+    for name, path, sheet, fingerprint in sources:
+        segment = _cached_sheet(sheet_dir, fingerprint)
+        if not os.path.exists(segment):
+            if os.path.exists(_cached_sheet(sheet_dir, fingerprint, ".skip")):
+                continue
+            # Removed since it was compiled (e.g. pruned by another worker).
+            # Compile it again: the version's hash covers this sheet, so the
+            # snapshot must not be written without it.
+            compile_changed_sheets(sources, sheet_dir)
+            if not os.path.exists(segment):
+                raise FileNotFoundError(f"Compiled sheet {name} disappeared: {segment}")
+        segments.append((name, segment))
+        manifest["sources"][name] = [path, sheet]
+        with open(_cached_sheet(sheet_dir, fingerprint, ".json")) as f:
+            manifest["errors"][name] = json.load(f)
+
+    # Build into a private directory and rename it into place so a concurrent
+    # reader never sees a half-written snapshot
+    staging = f"{target}.tmp{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    bank_file = os.path.join(staging, BANK_FILE_NAME)
+    write_bank_file(bank_file, segments)
+    buf, sheets = map_bank_file(bank_file)
+    try:
+        manifest["clusters"] = cluster_sheets(sheets)
+    finally:
+        buf.close()
+    with open(os.path.join(staging, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    try:
+        os.rename(staging, target)
+    except OSError:
+        # Another process won the race; its snapshot is identical
+        shutil.rmtree(staging, ignore_errors=True)
+    prune_snapshots(version, snapshot_dir)
+    return target
+
+
+def prune_snapshots(keep_hash, snapshot_dir=SNAPSHOT_DIR, keep=KEEP_VERSIONS):
+    """
+    Remove all but the newest `keep` snapshots (always keeping keep_hash and
+    any snapshot whose lease was renewed within VERSION_LEASE), snapshots of
+    older formats, and cached sheets none of them use (once older than
+    SHEET_GRACE)
+    """
+    current = os.path.basename(snapshot_path(keep_hash, snapshot_dir))
+    snapshots = [
+        entry for entry in os.listdir(snapshot_dir)
+        if entry != SHEET_CACHE_DIR and ".tmp" not in entry and entry != current
+    ]
+    mtimes = {entry: os.path.getmtime(os.path.join(snapshot_dir, entry)) for entry in snapshots}
+    snapshots.sort(key=mtimes.get, reverse=True)
+    usable = [entry for entry in snapshots if entry.endswith(f"-v{SNAPSHOT_FORMAT}")]
+    leased = [entry for entry in usable if mtimes[entry] > time.time() - VERSION_LEASE]
+    kept = [current] + list(dict.fromkeys(usable[:keep - 1] + leased))
+    for entry in snapshots:
+        if entry not in kept:
+            shutil.rmtree(os.path.join(snapshot_dir, entry), ignore_errors=True)
+
+    in_use = set()
+    for entry in kept:
+        try:
+            with open(os.path.join(snapshot_dir, entry, MANIFEST_NAME)) as f:
+                in_use.update(fingerprint[:32] for fingerprint in json.load(f).get("fingerprints", ()))
+        except (OSError, ValueError):
+            continue
+    # Sheets compiled within SHEET_GRACE may belong to a snapshot another
+    # worker sharing snapshot_dir is still building, so they stay too
+    sheet_dir = os.path.join(snapshot_dir, SHEET_CACHE_DIR)
+    recent = time.time() - SHEET_GRACE
+    for entry in os.listdir(sheet_dir):
+        stem, suffix = os.path.splitext(entry)
+        if ".tmp" in entry or (stem in in_use and suffix in (".seg", ".json", ".skip")):
+            continue
+        try:
+            if os.path.getmtime(os.path.join(sheet_dir, entry)) < recent:
+                os.remove(os.path.join(sheet_dir, entry))
+        except OSError:
+            # Removed by another worker's prune
+            pass
+
+
+class MappedSheet(Sequence):
+    """
+    Questions of one sheet, decoded on access from the memory-mapped bank
+    file. Nothing is copied until a question is read.
+    """
+
+    __slots__ = ("_buf", "_offset", "_count", "_heap")
+
+    def __init__(self, buf, offset, count, heap):
+        self._buf = buf
+        self._offset = offset
+        self._count = count
+        self._heap = heap
+
+    def __len__(self):
+        return self._count
+
+    def _string(self, offset, length):
+        if offset == NO_STRING:
+            return None
+        start = self._heap + offset
+        return str(self._buf[start:start + length], "utf-8")
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("question index out of range")
+        fields = RECORD.unpack_from(self._buf, self._offset + index * RECORD.size)
+        number, answer_mask, multi, present = fields[:4]
+        refs = fields[4:]
+        keys = []
+        options = []
+        for i, key in enumerate(OPTION_KEYS):
+            if present >> i & 1:
+                keys.append(key)
+                options.append(self._string(refs[2 + 2 * i], refs[3 + 2 * i]))
+        return Question(
+            number=number,
+            text=self._string(refs[0], refs[1]),
+            options=tuple(options),
+            keys=tuple(keys),
+            answer_mask=answer_mask,
+            multi=bool(multi),
+            explanation=self._string(refs[12], refs[13]),
+        )
+
+
+class PooledSheet(Sequence):
+    """
+    Several sheets viewed as one sequence, in sheet order. locate() maps a
+    pooled index back to its sheet and index there (for images and stats).
+    """
+
+    __slots__ = ("names", "_sheets", "_starts")
+
+    def __init__(self, sheets):
+        self.names = list(sheets)
+        self._sheets = [sheets[name] for name in self.names]
+        self._starts = [0]
+        for questions in self._sheets:
+            self._starts.append(self._starts[-1] + len(questions))
+
+    def __len__(self):
+        return self._starts[-1]
+
+    def _position(self, index):
+        if not 0 <= index < len(self):
+            raise IndexError("question index out of range")
+        sheet = bisect.bisect_right(self._starts, index) - 1
+        return sheet, index - self._starts[sheet]
+
+    def sheet_range(self, name):
+        """Pooled indices of one sheet's questions"""
+        sheet = self.names.index(name)
+        return range(self._starts[sheet], self._starts[sheet + 1])
+
+    def locate(self, index):
+        """(sheet name, index within that sheet) for a pooled index"""
+        sheet, local = self._position(index)
+        return self.names[sheet], local
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        sheet, local = self._position(index)
+        return self._sheets[sheet][local]
+
+
+class QuestionBank(Mapping):
+    """
+    Read-only mapping of test name -> sequence of Question records backed by
+    a compiled snapshot. The bank file is memory-mapped read-only, so every
+    worker process on a host shares the same page-cache copy.
+    """
+
+    def __init__(self, snapshot):
+        with open(os.path.join(snapshot, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+        self.snapshot = snapshot
+        self.sha256 = manifest["sha256"]
+        self._errors = manifest["errors"]
+        self._clusters = manifest["clusters"]
+        self._buf, self._sheets = map_bank_file(os.path.join(snapshot, BANK_FILE_NAME))
+
+    def __getitem__(self, name):
+        return self._sheets[name]
+
+    def questions(self, name):
+        """Questions of a sheet, or of every pooled sheet for POOLED_TEST"""
+        if name == POOLED_TEST:
+            return self.pooled()
+        return self._sheets[name]
+
+    def source(self, name, index):
+        """Sheet and original question number (for images) behind an index into questions(name)"""
+        if name == POOLED_TEST:
+            name, index = self.pooled().locate(index)
+        return name, index + 1
+
+    def clusters(self, name):
+        """Near-duplicate cluster label of each question in a sheet"""
+        return self._clusters[name]
+
+    def pooled_clusters(self):
+        """Cluster labels aligned with pooled() indices"""
+        return [label for name in self.pooled().names for label in self._clusters[name]]
+
+    def pooled(self):
+        """Every sheet except POOL_EXCLUDE as one PooledSheet (built once)"""
+        if getattr(self, "_pooled", None) is None:
+            self._pooled = PooledSheet({
+                name: questions for name, questions in self._sheets.items() if name not in POOL_EXCLUDE
+            })
+        return self._pooled
+
+    def validation_errors(self, name):
+        """
+        Problems found in a sheet's rows when it was compiled, as
+        {"total": count, "rows": [{"row", "column", "message"}, ...]} with
+        at most MAX_REPORTED_ERRORS rows listed
+        """
+        return self._errors[name]
+
+    def __iter__(self):
+        return iter(self._sheets)
+
+    def __len__(self):
+        return len(self._sheets)
+
+
+class InMemoryBank(QuestionBank):
+    """Fallback used when the snapshot directory cannot be written"""
+
+    def __init__(self, sources):
+        from openpyxl import load_workbook
+
+        self.snapshot = None
+        self.sha256 = bank_version(sources)
+        self._errors = {}
+        self._sheets = {}
+        for path in dict.fromkeys(path for _, path, _, _ in sources):
+            workbook = load_workbook(path, read_only=True, data_only=True)
+            try:
+                for name, source, sheet, _ in sources:
+                    rows = sheet_rows(workbook, sheet) if source == path else None
+                    if rows is None:
+                        continue
+                    errors = []
+                    self._sheets[name] = tuple(
+                        normalize_row(number, row, errors) for number, row in enumerate(rows, start=1)
+                    )
+                    self._errors[name] = {"total": len(errors), "rows": errors[:MAX_REPORTED_ERRORS]}
+            finally:
+                workbook.close()
+        self._clusters = cluster_sheets(self._sheets)
+
+
+def open_bank(bank_dir=BANK_DIR, snapshot_dir=SNAPSHOT_DIR, sources=None):
+    """
+    Opens the compiled snapshot for the current workbooks, compiling it first
+    if any sheet changed since the last build. Falls back to parsing the
+    workbooks in memory if the snapshot cannot be written.
+    """
+    if sources is None:
+        sources = list_sources(bank_dir)
+    try:
+        snapshot = compile_snapshot(sources, snapshot_dir)
+        return QuestionBank(snapshot)
+    except OSError as e:
+        logging.getLogger(__name__).warning("Question bank snapshot unavailable (%s); parsing workbooks directly", e)
+        return InMemoryBank(sources)
+
+
+class BankWatcher:
+    """
+    Keeps the current bank version and swaps in a new one when the workbooks
+    change. A background thread polls the workbooks' mtimes and sizes; only
+    touched workbooks are fingerprinted again, and only changed sheets are
+    re-parsed. The new bank replaces `current` in one assignment. Earlier
+    versions stay available through bank(version) so sessions keep the
+    version they started on: the last KEEP_VERSIONS, and any version a
+    session used within VERSION_LEASE (its lease, renewed by bank(version)).
+    """
+
+    def __init__(self, bank_dir=BANK_DIR, snapshot_dir=SNAPSHOT_DIR, interval=POLL_INTERVAL):
+        self.bank_dir = bank_dir
+        self.snapshot_dir = snapshot_dir
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._versions = OrderedDict()
+        self._used = {}
+        self._renewed = {}
+        self._stamps = ()
+        self._fingerprints = {}
+        self.current = None
+        self.check()
+        if interval:
+            threading.Thread(target=self._watch, name="bank-watcher", daemon=True).start()
+
+    def check(self):
+        """Reload if a workbook changed; returns True when a new version was swapped in"""
+        paths = discover_workbooks(self.bank_dir)
+        stamps = workbook_stamps(paths)
+        if stamps == self._stamps:
+            return False
+        # Only workbooks whose stamp moved are fingerprinted again
+        fingerprints = {}
+        seen = {}
+        for stamp in stamps:
+            if stamp in self._fingerprints:
+                fingerprints[stamp] = seen[stamp] = self._fingerprints[stamp]
+                continue
+            try:
+                fingerprints[stamp] = seen[stamp] = sheet_fingerprints(stamp[0])
+            except ValueError as e:
+                logging.getLogger(__name__).warning("Skipping workbook: %s", e)
+                previous = [sheets for old, sheets in self._fingerprints.items() if old[0] == stamp[0]]
+                if previous:
+                    # Probably mid-save: keep its last good sheets and retry on the next poll
+                    fingerprints[stamp] = previous[0]
+                    seen[(stamp[0], None, None)] = previous[0]
+                else:
+                    seen[stamp] = []
+        sources = list_sources(workbooks={stamp[0]: sheets for stamp, sheets in fingerprints.items()})
+        changed = self.current is None or bank_version(sources) != self.current.sha256
+        if changed:
+            bank = open_bank(self.bank_dir, self.snapshot_dir, sources)
+            with self._lock:
+                self._versions[bank.sha256] = bank
+                # Oldest first; versions with a live lease stay in memory
+                expired = time.monotonic() - VERSION_LEASE
+                for version in list(self._versions)[:-KEEP_VERSIONS]:
+                    if self._used.get(version, float("-inf")) < expired:
+                        del self._versions[version]
+                        self._used.pop(version, None)
+                        self._renewed.pop(version, None)
+                self.current = bank
+        self._stamps, self._fingerprints = tuple(seen), seen
+        return changed
+
+    def bank(self, version=None):
+        """
+        The current bank, or the version a session is pinned to, renewing
+        that version's lease (KeyError once it is gone)
+        """
+        current = self.current
+        if version is None:
+            return current
+        if version == current.sha256:
+            self._renew(version)
+            return current
+        with self._lock:
+            bank = self._versions.get(version)
+        if bank is None:
+            # Still on disk, e.g. a session resumed in a freshly started process
+            snapshot = snapshot_path(version, self.snapshot_dir)
+            if not os.path.exists(os.path.join(snapshot, MANIFEST_NAME)):
+                raise KeyError(version)
+            bank = QuestionBank(snapshot)
+            with self._lock:
+                self._versions[version] = bank
+                self._versions.move_to_end(version, last=False)
+        self._renew(version)
+        return bank
+
+    def _renew(self, version):
+        now = time.monotonic()
+        self._used[version] = now
+        if now - self._renewed.get(version, -LEASE_RENEW_INTERVAL) < LEASE_RENEW_INTERVAL:
+            return
+        self._renewed[version] = now
+        # prune_snapshots keeps snapshots touched within VERSION_LEASE
+        try:
+            os.utime(snapshot_path(version, self.snapshot_dir))
+        except OSError:
+            pass
+
+    def _watch(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                if self.check():
+                    logging.getLogger(__name__).info("Question bank reloaded: version %s", self.current.sha256[:16])
+            except Exception as e:
+                # e.g. a workbook caught mid-save; the next poll retries
+                logging.getLogger(__name__).warning("Question bank reload failed: %s", e)
+
+
+def _measure_startup(bank_dir=BANK_DIR, snapshot_dir=SNAPSHOT_DIR):
+    """Compare cold loads: the old per-sheet read_excel against the snapshot"""
+    import pandas as pd
+
+    sources = list_sources(bank_dir)
+    bank = open_bank(bank_dir, snapshot_dir, sources)
+    start = time.perf_counter()
+    for name, path, sheet, _ in sources:
+        if name in bank:
+            pd.read_excel(path, sheet_name=sheet)
+    excel_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    bank = open_bank(bank_dir, snapshot_dir)
+    open_time = time.perf_counter() - start
+    first_sheet = next(iter(bank))
+    bank[first_sheet]
+    first_time = time.perf_counter() - start
+    for name in bank:
+        bank[name]
+    all_time = time.perf_counter() - start
+
+    print(f"read_excel, all sheets:        {excel_time * 1000:8.1f} ms")
+    print(f"snapshot open (fingerprints):  {open_time * 1000:8.1f} ms")
+    print(f"snapshot, first sheet:         {first_time * 1000:8.1f} ms")
+    print(f"snapshot, all sheets:          {all_time * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    # python question_bank.py          -> compile the snapshot
+    # python question_bank.py --bench  -> compile and compare cold-start times
+    # python question_bank.py --validate -> compile and list row problems
+    if "--bench" in sys.argv:
+        _measure_startup()
+    elif "--validate" in sys.argv:
+        bank = open_bank()
+        for name in bank:
+            report = bank.validation_errors(name)
+            print(f"{name}: {len(bank[name])} questions, {report['total']} row problem(s)")
+            for error in report["rows"]:
+                print(f"  row {error['row']} ({error['column']}): {error['message']}")
+            if report["total"] > len(report["rows"]):
+                print(f"  ... {report['total'] - len(report['rows'])} more")
+    else:
+        print(compile_snapshot())
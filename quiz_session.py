@@ -0,0 +1,95 @@
+import json
+import random
+import struct
+from array import array
+
+# Session fields checkpointed alongside the arrays
+CHECKPOINT_FIELDS = (
+    "page", "selected_test", "current_question", "score",
+    "start_time", "current_question_start_time", "total_quiz_time", "mode", "topic",
+)
+_LENGTH = struct.Struct("<I")
+
+# Per-question flag bits
+ANSWERED = 1   # "Show Answer" was clicked
+SCORED = 2     # the question has been scored (counted at most once)
+ASSIGNED = 4   # adaptive mode: the scheduler has picked this position's question
+
+
+class QuizState:
+    """
+    Per-session quiz progress in fixed-size arrays, indexed by position in
+    the quiz (0 = first question shown):
+      order       question index in the sheet or pool (uint16)
+      selections  selected options as a bitmask over A-E
+      times       seconds spent on the question (float32)
+      flags       ANSWERED | SCORED | ASSIGNED bits
+    """
+
+    __slots__ = ("order", "selections", "times", "flags")
+
+    def __init__(self, order=(), num_questions=None):
+        n = len(order)
+        if num_questions is None:
+            num_questions = n
+        self.order = array("H" if num_questions <= 0xFFFF else "I", order)
+        self.selections = bytearray(n)
+        self.times = array("f", bytes(4 * n))
+        self.flags = bytearray(n)
+
+    @classmethod
+    def shuffled(cls, num_questions):
+        """State for a new quiz over num_questions questions in random order"""
+        order = list(range(num_questions))
+        random.shuffle(order)
+        return cls(order)
+
+    @classmethod
+    def unassigned(cls, length, num_questions):
+        """State for an adaptive quiz of `length` positions whose questions are picked as it goes"""
+        return cls([0] * length, num_questions)
+
+    def __len__(self):
+        return len(self.order)
+
+    def has_flag(self, position, flag):
+        return bool(self.flags[position] & flag)
+
+    def set_flag(self, position, flag):
+        self.flags[position] |= flag
+
+    def to_bytes(self):
+        """Arrays as raw bytes: order, selections, times, flags"""
+        return self.order.tobytes() + bytes(self.selections) + self.times.tobytes() + bytes(self.flags)
+
+    @classmethod
+    def from_bytes(cls, data, num_questions, typecode="H"):
+        state = cls()
+        state.order = array(typecode)
+        end = state.order.itemsize * num_questions
+        state.order.frombytes(data[:end])
+        state.selections = bytearray(data[end:end + num_questions])
+        end += num_questions
+        state.times = array("f")
+        state.times.frombytes(data[end:end + 4 * num_questions])
+        end += 4 * num_questions
+        state.flags = bytearray(data[end:end + num_questions])
+        return state
+
+
+def dump_checkpoint(fields, quiz):
+    """
+    Serialize session fields (a dict of CHECKPOINT_FIELDS plus anything else
+    JSON-able) and the quiz arrays into one compact blob.
+    """
+    header = dict(fields, num_questions=len(quiz), typecode=quiz.order.typecode)
+    header = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    return _LENGTH.pack(len(header)) + header + quiz.to_bytes()
+
+
+def load_checkpoint(data):
+    """Inverse of dump_checkpoint: returns (fields, QuizState)"""
+    (length,) = _LENGTH.unpack_from(data, 0)
+    fields = json.loads(data[_LENGTH.size:_LENGTH.size + length])
+    quiz = QuizState.from_bytes(data[_LENGTH.size + length:], fields.pop("num_questions"), fields.pop("typecode"))
+    return fields, quiz
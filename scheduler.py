@@ -0,0 +1,121 @@
+"""
+Spaced-repetition scheduler for the adaptive practice mode.
+
+Items (question indices) sit in a binary heap ordered by the step (question
+position) at which they are next due, so picking the next question and
+rescheduling an answered one are both O(log n) however many sheets are
+pooled. Intervals follow SM-2, with the grade derived from correctness and
+answer latency, and are measured in questions rather than days because a
+practice session is short.
+"""
+import heapq
+import random
+import struct
+from array import array
+
+# Seconds per question in the real exam (230 minutes for 180 questions)
+TARGET_SECONDS = 76
+# A missed question comes back after this many other questions
+RELEARN_GAP = 3
+# Interval after the first correct answer, in questions
+FIRST_INTERVAL = 8
+MIN_EASE = 1.3
+START_EASE = 2.5
+# Longest interval, in questions: well past any practice session, and it
+# keeps due steps (position + interval) small enough to pack into a key
+MAX_INTERVAL = 1000
+
+# Heap keys are single ints: due step, then priority (reviews of weak items
+# before new ones), then item index, packed to fit an unsigned 64-bit int
+_ITEM_BITS = 20
+_PRIORITY_BITS = 14
+_NEW_PRIORITY = 1 << (_PRIORITY_BITS - 1)
+_MAX_DUE = (1 << (64 - _PRIORITY_BITS - _ITEM_BITS)) - 1
+_HEADER = struct.Struct("<II")
+
+
+def grade(correct, seconds):
+    """SM-2 quality (0-5) from correctness and answer latency"""
+    if not correct:
+        return 1
+    if seconds <= TARGET_SECONDS:
+        return 5
+    if seconds <= 2 * TARGET_SECONDS:
+        return 4
+    return 3
+
+
+class AdaptiveScheduler:
+    __slots__ = ("ease", "interval", "reps", "heap")
+
+    def __init__(self, num_items=0, rng=random):
+        if num_items >= 1 << _ITEM_BITS:
+            raise ValueError("too many questions for the adaptive scheduler")
+        self.ease = array("f", [START_EASE]) * num_items
+        self.interval = array("f", bytes(4 * num_items))
+        self.reps = bytearray(num_items)
+        # New items are introduced one per step, in random order
+        order = list(range(num_items))
+        rng.shuffle(order)
+        self.heap = [self._key(due, _NEW_PRIORITY + rng.randrange(_NEW_PRIORITY), item)
+                     for due, item in enumerate(order)]
+        # Keys are generated in increasing due order, so the list is already a heap
+
+    @staticmethod
+    def _key(due, priority, item):
+        return (due << (_PRIORITY_BITS + _ITEM_BITS)) | (priority << _ITEM_BITS) | item
+
+    def __len__(self):
+        return len(self.heap)
+
+    def next_item(self):
+        """Remove and return the item due soonest (None if there are no items)"""
+        if not self.heap:
+            return None
+        return heapq.heappop(self.heap) & ((1 << _ITEM_BITS) - 1)
+
+    def peek(self):
+        """The item next_item() would return, without removing it"""
+        if not self.heap:
+            return None
+        return self.heap[0] & ((1 << _ITEM_BITS) - 1)
+
+    def review(self, item, step, correct, seconds):
+        """Reschedule an item shown at `step` after it was answered"""
+        quality = grade(correct, seconds)
+        ease = self.ease[item] + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02)
+        self.ease[item] = max(MIN_EASE, ease)
+        if quality < 3:
+            self.reps[item] = 0
+            self.interval[item] = RELEARN_GAP
+        else:
+            self.reps[item] = min(self.reps[item] + 1, 255)
+            if self.reps[item] == 1:
+                self.interval[item] = FIRST_INTERVAL
+            else:
+                self.interval[item] = min(self.interval[item] * self.ease[item], MAX_INTERVAL)
+        due = min(step + max(1, round(self.interval[item])), _MAX_DUE)
+        # Lower ease = weaker item = earlier among items due at the same step
+        priority = min(int(self.ease[item] * 1000), _NEW_PRIORITY - 1)
+        heapq.heappush(self.heap, self._key(due, priority, item))
+
+    def to_bytes(self):
+        heap = array("Q", self.heap)
+        return (_HEADER.pack(len(self.reps), len(heap)) + self.ease.tobytes()
+                + self.interval.tobytes() + bytes(self.reps) + heap.tobytes())
+
+    @classmethod
+    def from_bytes(cls, data):
+        num_items, heap_size = _HEADER.unpack_from(data, 0)
+        scheduler = cls()
+        end = _HEADER.size
+        scheduler.ease.frombytes(data[end:end + 4 * num_items])
+        end += 4 * num_items
+        scheduler.interval.frombytes(data[end:end + 4 * num_items])
+        end += 4 * num_items
+        scheduler.reps = bytearray(data[end:end + num_items])
+        end += num_items
+        heap = array("Q")
+        heap.frombytes(data[end:end + 8 * heap_size])
+        scheduler.heap = heap.tolist()
+        return scheduler
@@ -0,0 +1,155 @@
+"""
+Full-text search over the question bank for topic practice.
+
+An inverted index (term -> question ids and term frequencies) is built once
+per bank version over each question's text, options and explanation, and
+queries are ranked with BM25, so a search touches only the postings of its
+own terms instead of scanning every question.
+
+    python search_index.py "risk register"     # print the best matches
+"""
+import functools
+import heapq
+import math
+import re
+import sys
+import time
+from array import array
+
+# BM25 parameters (the usual defaults)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from has have how if in into is it its
+of on or that the their them then there these they this to was what when which
+who will with would should could not no all any each following best most
+""".split())
+
+# Longest first; one suffix is removed per word (a light Porter-style stemmer)
+SUFFIXES = (
+    "ational", "ization", "iveness", "fulness", "ations", "ation", "ements", "ement",
+    "ments", "ment", "ness", "ities", "ity", "ings", "ing", "ies", "ied", "edly",
+    "ed", "ers", "er", "ly", "es", "s",
+)
+MIN_STEM = 3
+# Suffixes that need a longer stem left ("apply" is not "app" + "ly")
+MIN_STEM_BEFORE = {"ly": 4}
+# A final "s" after these is part of the word ("process", "status", "analysis")
+KEEP_S = ("ss", "us", "is")
+# A doubled final consonant left by these is undoubled ("planning" -> "plan"),
+# except for letters that double in the base word ("install", "process", "buzz")
+UNDOUBLE_AFTER = frozenset(("ings", "ing", "edly", "ed", "ers", "er"))
+KEEP_DOUBLE = frozenset("lsz")
+VOWELS = frozenset("aeiou")
+
+
+@functools.lru_cache(maxsize=65536)
+def stem(word):
+    # "analysis" and "analyses" share a stem
+    if word.endswith("sis") and len(word) - 3 >= MIN_STEM:
+        word = word[:-2] + "es"
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM_BEFORE.get(suffix, MIN_STEM):
+            if suffix == "s" and word.endswith(KEEP_S):
+                break
+            word = word[:-len(suffix)]
+            if suffix in ("ies", "ied"):
+                # "policies"/"policy", "applied"/"apply" (see below)
+                word += "i"
+            elif (suffix in UNDOUBLE_AFTER and len(word) > MIN_STEM and word[-1] == word[-2]
+                  and word[-1] not in VOWELS and word[-1] not in KEEP_DOUBLE):
+                word = word[:-1]
+            break
+    # "policy" and "policies" share a stem
+    if word.endswith("y") and len(word) > MIN_STEM and word[-2] not in VOWELS:
+        word = word[:-1] + "i"
+    # "issue"/"issues" and "manage"/"managed" share a stem
+    if word.endswith("e") and len(word) > MIN_STEM:
+        word = word[:-1]
+    return word
+
+
+def tokenize(text):
+    """Lowercased, stemmed terms of a text, stopwords removed"""
+    if not text:
+        return []
+    return [stem(word) for word in _TOKEN.findall(text.lower()) if word not in STOPWORDS]
+
+
+def question_terms(question):
+    terms = tokenize(question.text)
+    for option in question.options:
+        terms.extend(tokenize(option))
+    terms.extend(tokenize(question.explanation))
+    return terms
+
+
+class SearchIndex:
+    """
+    BM25 index over a sequence of Question records; results are indices into
+    that sequence. Postings are compact arrays of (question id, frequency).
+    """
+
+    def __init__(self, questions):
+        postings = {}
+        self.lengths = array("I")
+        for doc_id, question in enumerate(questions):
+            counts = {}
+            terms = question_terms(question)
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            for term, count in counts.items():
+                postings.setdefault(term, []).append((doc_id, count))
+            self.lengths.append(len(terms))
+        self.num_docs = len(self.lengths)
+        self.avg_length = sum(self.lengths) / self.num_docs if self.num_docs else 0.0
+        self.postings = {}
+        self.idf = {}
+        for term, entries in postings.items():
+            self.postings[term] = (array("I", [doc_id for doc_id, _ in entries]),
+                                   array("H", [min(count, 0xFFFF) for _, count in entries]))
+            df = len(entries)
+            self.idf[term] = math.log(1 + (self.num_docs - df + 0.5) / (df + 0.5))
+
+    def __len__(self):
+        return self.num_docs
+
+    def search(self, query, limit=None):
+        """(question index, score) pairs for the query, best first"""
+        scores = {}
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+            idf = self.idf[term]
+            doc_ids, counts = self.postings[term]
+            for doc_id, count in zip(doc_ids, counts):
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[doc_id] / self.avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * count * (BM25_K1 + 1) / (count + norm)
+        if limit is None:
+            return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+
+def main(argv):
+    from question_bank import open_bank
+
+    bank = open_bank()
+    questions = bank.pooled()
+    start = time.perf_counter()
+    index = SearchIndex(questions)
+    build_ms = (time.perf_counter() - start) * 1000
+    print(f"Indexed {len(index)} questions, {len(index.postings)} terms in {build_ms:.1f} ms")
+    query = " ".join(argv) or "risk register"
+    start = time.perf_counter()
+    results = index.search(query, limit=10)
+    print(f"{query!r}: {(time.perf_counter() - start) * 1000:.2f} ms")
+    for doc_id, score in results:
+        sheet, local = questions.locate(doc_id)
+        print(f"{score:6.2f}  {sheet} #{local + 1}: {questions[doc_id].text[:80]!r}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
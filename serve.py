@@ -0,0 +1,28 @@
+"""
+Start the quiz app with a warm-up at launch.
+
+    QUIZ_READY_PORT=8502 python serve.py [streamlit options]
+
+Same as `streamlit run test_engine.py [options]`, except that the question
+bank and the image index are built in parallel while the server starts, and
+GET :QUIZ_READY_PORT/ready turns 200 once they are (see warmup.py).
+"""
+import os
+import sys
+
+import warmup
+
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_engine.py")
+
+
+def main(argv):
+    warmup.start()
+    # Imported after the warm-up threads are running, so the two overlap
+    from streamlit.web import cli
+
+    sys.argv = ["streamlit", "run", APP_FILE, *argv]
+    return cli.main()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
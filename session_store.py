@@ -0,0 +1,137 @@
+"""
+Pluggable storage for quiz session checkpoints, so an exam survives worker
+restarts and reconnects routed to another process or host.
+
+Backends are chosen with QUIZ_SESSION_STORE:
+    sqlite:///path/to/sessions.db   (default: sqlite:///.sessions.db)
+    memory://                       per-process only, for development
+    none                            disable checkpointing
+"""
+import atexit
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_STORE_URL = "sqlite:///.sessions.db"
+# Checkpoints are buffered and written in one transaction at this interval
+FLUSH_INTERVAL = 0.5
+# Checkpoints older than this are purged when the store is opened
+MAX_AGE = 7 * 24 * 3600
+
+
+class SessionStore:
+    """Interface: opaque checkpoint bytes keyed by resume token"""
+
+    def save(self, token, data):
+        raise NotImplementedError
+
+    def load(self, token):
+        raise NotImplementedError
+
+    def delete(self, token):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    def __init__(self):
+        self._data = {}
+
+    def save(self, token, data):
+        self._data[token] = data
+
+    def load(self, token):
+        return self._data.get(token)
+
+    def delete(self, token):
+        self._data.pop(token, None)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    SQLite in WAL mode. save() only records the latest checkpoint per token
+    in memory; a background thread writes the pending set in one batch every
+    FLUSH_INTERVAL seconds, so bursts of callbacks coalesce into one row write.
+    """
+
+    def __init__(self, path, flush_interval=FLUSH_INTERVAL, max_age=MAX_AGE):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (token TEXT PRIMARY KEY, data BLOB NOT NULL, updated REAL NOT NULL)"
+        )
+        self._conn.execute("DELETE FROM sessions WHERE updated < ?", (time.time() - max_age,))
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        threading.Thread(target=self._flush_loop, name="session-store-flush", daemon=True).start()
+        atexit.register(self.flush)
+
+    def save(self, token, data):
+        with self._lock:
+            self._pending[token] = data
+        self._wakeup.set()
+
+    def load(self, token):
+        with self._lock:
+            if token in self._pending:
+                return self._pending[token]
+            row = self._conn.execute("SELECT data FROM sessions WHERE token = ?", (token,)).fetchone()
+        return row[0] if row and row[0] is not None else None
+
+    def delete(self, token):
+        # A pending None is written as a delete, in order with other writes
+        self.save(token, None)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            now = time.time()
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO sessions (token, data, updated) VALUES (?, ?, ?)",
+                    [(token, data, now) for token, data in pending.items() if data is not None],
+                )
+                self._conn.executemany(
+                    "DELETE FROM sessions WHERE token = ?",
+                    [(token,) for token, data in pending.items() if data is None],
+                )
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                # Keep the checkpoints for the next attempt unless newer ones arrived
+                for token, data in pending.items():
+                    self._pending.setdefault(token, data)
+                raise
+
+    def _flush_loop(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except sqlite3.Error:
+                self._wakeup.set()
+
+
+def open_store(url=None):
+    """Create the backend named by url (or QUIZ_SESSION_STORE); None if disabled"""
+    if url is None:
+        url = os.environ.get("QUIZ_SESSION_STORE", DEFAULT_STORE_URL)
+    if url == "none":
+        return None
+    if url.startswith("memory://"):
+        return MemorySessionStore()
+    if url.startswith("sqlite:///"):
+        return SQLiteSessionStore(url[len("sqlite:///"):])
+    raise ValueError(f"Unknown session store: {url}")
@@ -1,82 +1,305 @@
 import streamlit as st
-import pandas as pd
 import time
 from datetime import datetime, timedelta
-import base64
-from PIL import Image
+import logging
 import os
-import io
+import secrets
+import uuid
+import base64
 import random
-from streamlit_autorefresh import st_autorefresh
+import streamlit.components.v1 as components
+import metrics
+from analytics import AnalyticsStore
+from dedup import stratified_sample
+from image_assets import INLINE_WIDTH, STATIC_URL_PREFIX, ImageCache, pick_variant
+from prefetch import Prefetcher
+from question_bank import KEEP_VERSIONS, POOLED_TEST
+from quiz_session import ANSWERED, ASSIGNED, CHECKPOINT_FIELDS, SCORED, QuizState, dump_checkpoint, load_checkpoint
+from scheduler import AdaptiveScheduler
+from search_index import SearchIndex
+from session_store import open_store
+import warmup
+
+# Opt-in rerun instrumentation (see metrics.py); a no-op unless enabled.
+# Started before anything else so the rerun's total covers the whole script.
+metrics.start()
+metrics.begin_rerun()
 
 # Set page configuration - MUST be the first Streamlit command
 st.set_page_config(page_title="PMP Practice Exam", layout="wide")
 
-# Auto-refresh every 1 second to update the timer (must come after set_page_config)
-st_autorefresh(interval=1000, key="timer_refresh")
+# Index of the Pictures folder, scanned once per server process (at launch under serve.py)
+@st.cache_resource
+def get_image_index():
+    return warmup.shared("image_index")
 
-# Function to get image path for a question
-def get_question_image_path(sheet_name, question_number):
-    """
-    Searches for an image file related to the current question in the Pictures folder structure.
-    Returns the path if found, None otherwise.
-    """
-    # Define possible file name patterns
-    possible_patterns = [
-        f"Question {question_number}.png",
-        f"Question{question_number}.png",
-        f"Q{question_number}.png",
-        f"Picture{question_number}.png",
-        f"{question_number}.png"
-    ]
-    
-    # Base directory for pictures
-    base_dir = os.path.join("Pictures", sheet_name)
-    
-    # Check if the directory exists
-    if not os.path.exists(base_dir):
-        return None
-        
-    # Check for each possible pattern
-    for pattern in possible_patterns:
-        path = os.path.join(base_dir, pattern)
-        if os.path.exists(path):
-            return path
-            
-    return None
+# Encoded images and static copies, shared by all sessions
+@st.cache_resource
+def get_image_cache():
+    return ImageCache()
 
 # Function to get image as base64 string
 def get_image_as_base64(image_path):
-    """Convert an image file to base64 string for display"""
-    if not image_path or not os.path.exists(image_path):
+    """Convert an image file to a (cached) base64 data URI for display"""
+    if not image_path:
         return None
     
     try:
-        with open(image_path, "rb") as img_file:
-            img_bytes = img_file.read()
-            img_b64 = base64.b64encode(img_bytes).decode()
-            return f"data:image/png;base64,{img_b64}"
+        return get_image_cache().data_uri(image_path)
     except Exception as e:
         st.warning(f"Error loading image {image_path}: {e}")
         return None
 
-# Load the Excel file
-@st.cache_data
+@metrics.timed("image_render")
+def show_image(image_path, caption):
+    """
+    Display an image using its display-sized variants. With static serving
+    enabled, only content-hashed URLs are sent and the browser picks the
+    variant that fits the column; otherwise one variant is sent inline.
+    """
+    try:
+        variants = get_image_cache().variants(image_path)
+    except Exception as e:
+        # e.g. static/img cannot be written; the original is shown instead
+        logging.getLogger(__name__).warning("Error optimizing image %s: %s", image_path, e)
+        variants = [(None, image_path)]
+    
+    if st.get_option("server.enableStaticServing"):
+        try:
+            if variants[0][0] is None:
+                srcset = ""
+                src = get_image_cache().static_url(image_path)
+            else:
+                srcset = ", ".join(f"{STATIC_URL_PREFIX}{os.path.basename(path)} {width}w" for width, path in variants)
+                src = STATIC_URL_PREFIX + os.path.basename(variants[-1][1])
+        except Exception as e:
+            # No static copy either: fall back to sending the original inline
+            logging.getLogger(__name__).warning("Error serving image %s: %s", image_path, e)
+        else:
+            # The question column is 3/4 of the wide layout; full width on phones
+            st.markdown(
+                f'<figure style="margin: 0"><img src="{src}" srcset="{srcset}" '
+                f'sizes="(max-width: 640px) 100vw, 75vw" style="max-width: 100%">'
+                f'<figcaption style="font-size: 14px; opacity: 0.6">{caption}</figcaption></figure>',
+                unsafe_allow_html=True,
+            )
+            return
+    img_b64 = get_image_as_base64(pick_variant(variants, INLINE_WIDTH))
+    if img_b64:
+        st.image(img_b64, caption=caption)
+
+# Question bank compiled from every workbook in the bank directory (see
+# question_bank.py). A background thread reloads changed sheets and swaps the
+# new version in without a restart. Built at server launch under serve.py.
+@st.cache_resource
+def get_bank_watcher():
+    return warmup.shared("bank_watcher")
+
+@metrics.timed("load_data")
 def load_data():
-    excel_file = "PMP Practice Exam Question Bank_Update 2023 (1).xlsx"
-    sheets = {
-        "Core 260": "Core 260",
-        "25 Q1 2023": "25 Q1 2023",
-        "25 Q4 2022": "25 Q4 2022",
-        "55 Q2 2021": "55 Q2 2021",
-        "Test": "Test"
-    }
-    return {name: pd.read_excel(excel_file, sheet_name=sheet) for name, sheet in sheets.items()}
+    """The bank version this session's exam runs on (the current one between exams)"""
+    watcher = get_bank_watcher()
+    try:
+        return watcher.bank(st.session_state.get('bank_version'))
+    except KeyError:
+        end_lost_exam()
+        return watcher.current
+
+# Shown on the intro page when an exam had to be ended
+LOST_VERSION_NOTICE = ("The question bank was updated and the version this exam was running on is no "
+                       "longer available, so the exam was ended. Please start a new one.")
+
+def exam_lost():
+    """
+    End the exam if the bank version it is pinned to is gone (its lease ran
+    out, see question_bank.VERSION_LEASE). Returns True if it was ended.
+    """
+    version = st.session_state.get('bank_version')
+    if version is None:
+        return False
+    try:
+        get_bank_watcher().bank(version)
+        return False
+    except KeyError:
+        end_lost_exam()
+        return True
+
+def end_lost_exam():
+    reset_quiz()
+    st.session_state.notice = LOST_VERSION_NOTICE
+
+def get_questions(test_name, data=None):
+    """Questions of a sheet, or of every sheet pooled (adaptive, topic and mixed modes)"""
+    if data is None:
+        data = load_data()
+    return data.questions(test_name)
+
+def question_source(test_name, question_index):
+    """Sheet and original question number (for images) behind a question index"""
+    return load_data().source(test_name, question_index)
+
+# Render data of upcoming questions, prepared in the background (see prefetch.py)
+@st.cache_resource
+def get_prefetcher():
+    return Prefetcher(get_image_index(), get_image_cache())
+
+@metrics.timed("render_data")
+def get_render_data(position):
+    """Question, image sheet/number and image paths for a quiz position"""
+    quiz = st.session_state.quiz
+    return get_prefetcher().render_data(
+        load_data(), st.session_state.selected_test, quiz.order[position],
+        st.get_option("server.enableStaticServing"),
+    )
+
+def prefetch_neighbours(position):
+    """Start preparing the questions Next and Previous lead to"""
+    quiz = st.session_state.quiz
+    data = load_data()
+    for neighbour in (position + 1, position - 1):
+        if not 0 <= neighbour < len(quiz):
+            continue
+        if st.session_state.scheduler is None or quiz.has_flag(neighbour, ASSIGNED):
+            question_index = quiz.order[neighbour]
+        else:
+            # Adaptive mode assigns on Next; the scheduler's head is the likely pick
+            question_index = st.session_state.scheduler.peek()
+            if question_index is None:
+                continue
+        get_prefetcher().prefetch(
+            data, st.session_state.selected_test, question_index,
+            st.get_option("server.enableStaticServing"),
+        )
+
+# Full-text index over the pooled sheets, built once per bank version (the
+# bank itself is not hashed, only its version)
+@st.cache_resource(max_entries=KEEP_VERSIONS)
+def _build_search_index(bank_sha256, _bank):
+    return SearchIndex(_bank.pooled())
+
+def find_topic_questions(topic, limit):
+    """Pooled question indices best matching a topic, best first, one per near-duplicate cluster"""
+    # One bank for the index and the clusters, even if a reload lands meanwhile
+    data = load_data()
+    clusters = data.pooled_clusters()
+    seen = set()
+    matches = []
+    for doc_id, _ in _build_search_index(data.sha256, data).search(topic):
+        if clusters[doc_id] not in seen:
+            seen.add(clusters[doc_id])
+            matches.append(doc_id)
+            if len(matches) == limit:
+                break
+    return matches
+
+def build_mixed_exam(count):
+    """Up to count distinct questions sampled across the pooled sheets in proportion to their size"""
+    data = load_data()
+    pool = data.pooled()
+    strata = [pool.sheet_range(name) for name in pool.names]
+    return stratified_sample(strata, data.pooled_clusters(), count)
 
 def format_time(seconds):
     """Format seconds into hours:minutes:seconds"""
     return str(timedelta(seconds=int(seconds)))
 
+# Checkpoint store shared by all sessions (see session_store.py)
+@st.cache_resource
+def get_session_store():
+    try:
+        return open_store()
+    except Exception as e:
+        # e.g. a read-only app directory; exams just cannot be resumed
+        logging.getLogger(__name__).warning("Session checkpoints disabled: %s", e)
+        return None
+
+def checkpoint_session():
+    """Queue this session's compact state for the session store"""
+    # First, so an exam that just ended (lost bank version) is not saved
+    bank_sha256 = load_data().sha256
+    store = get_session_store()
+    resume_token = st.session_state.get('resume_token')
+    if store is None or resume_token is None:
+        return
+    fields = {name: st.session_state[name] for name in CHECKPOINT_FIELDS}
+    fields["bank"] = bank_sha256
+    if st.session_state.scheduler is not None:
+        fields["scheduler"] = base64.b64encode(st.session_state.scheduler.to_bytes()).decode("ascii")
+    store.save(resume_token, dump_checkpoint(fields, st.session_state.quiz))
+
+def resume_session(resume_token):
+    """Restore a checkpointed session; returns False if it cannot be resumed"""
+    store = get_session_store()
+    data = store.load(resume_token) if store is not None else None
+    if data is None:
+        return False
+    fields, quiz = load_checkpoint(data)
+    # The question order only makes sense against the same bank version, so
+    # the session stays on it if the bank was reloaded since
+    version = fields.pop("bank", None)
+    try:
+        questions = get_questions(fields["selected_test"], get_bank_watcher().bank(version))
+    except KeyError:
+        return False
+    if len(quiz) and max(quiz.order) >= len(questions):
+        return False
+    scheduler = fields.pop("scheduler", None)
+    for name, value in fields.items():
+        st.session_state[name] = value
+    st.session_state.bank_version = version
+    st.session_state.quiz = quiz
+    st.session_state.scheduler = AdaptiveScheduler.from_bytes(base64.b64decode(scheduler)) if scheduler else None
+    st.session_state.resume_token = resume_token
+    return True
+
+# Attempt history and per-question stats (see analytics.py)
+@st.cache_resource
+def get_analytics():
+    try:
+        return AnalyticsStore()
+    except Exception as e:
+        logging.getLogger(__name__).warning("Analytics disabled: %s", e)
+        return None
+
+def record_finished_attempt():
+    """Add the finished attempt to the analytics store"""
+    store = get_analytics()
+    if store is None:
+        return
+    quiz = st.session_state.quiz
+    test_name = st.session_state.selected_test
+    questions = get_questions(test_name)
+    # Stats are kept per source sheet, so pooled attempts are split by sheet
+    results_by_sheet = {}
+    for position, question_index in enumerate(quiz.order):
+        if quiz.has_flag(position, ANSWERED):
+            question = questions[question_index]
+            correct = bool(question.answer_mask) and quiz.selections[position] == question.answer_mask
+            sheet, _ = question_source(test_name, question_index)
+            results_by_sheet.setdefault(sheet, []).append((question.number, correct, quiz.times[position]))
+    for sheet, results in results_by_sheet.items():
+        if sheet == test_name:
+            score, total_time = st.session_state.score, st.session_state.total_quiz_time
+        else:
+            score = sum(correct for _, correct, _ in results)
+            total_time = sum(seconds for _, _, seconds in results)
+        try:
+            store.record_attempt(sheet, load_data().sha256, score, total_time, results)
+        except Exception as e:
+            logging.getLogger(__name__).warning("Could not record attempt: %s", e)
+
+def admin_requested():
+    """?admin=<QUIZ_ADMIN_TOKEN> opens the analytics page (closed while no token is set)"""
+    token = os.environ.get("QUIZ_ADMIN_TOKEN")
+    if not token or "admin" not in st.query_params:
+        return False
+    return secrets.compare_digest(st.query_params["admin"], token)
+
+# Restore a session from its resume token after a worker restart or a
+# reconnect routed to another process
+if 'page' not in st.session_state and "resume" in st.query_params:
+    resume_session(st.query_params["resume"])
+
 # Initialize session state variables
 if 'page' not in st.session_state:
     st.session_state.page = "intro"
@@ -84,162 +307,225 @@ if 'current_question' not in st.session_state:
     st.session_state.current_question = 0
 if 'score' not in st.session_state:
     st.session_state.score = 0
-if 'answers' not in st.session_state:
-    st.session_state.answers = {}
-if 'question_times' not in st.session_state:
-    st.session_state.question_times = {}
 if 'start_time' not in st.session_state:
     st.session_state.start_time = None
 if 'current_question_start_time' not in st.session_state:
     st.session_state.current_question_start_time = None
 if 'selected_test' not in st.session_state:
     st.session_state.selected_test = None
-if 'show_answer' not in st.session_state:
-    st.session_state.show_answer = {}
-if 'answered_questions' not in st.session_state:
-    st.session_state.answered_questions = set()
-if 'multi_select_answers' not in st.session_state:
-    st.session_state.multi_select_answers = {}
 if 'total_quiz_time' not in st.session_state:
     st.session_state.total_quiz_time = None
-if 'randomized_questions' not in st.session_state:
-    st.session_state.randomized_questions = []
+if 'quiz' not in st.session_state:
+    # Per-question order, answers, times and flags (see quiz_session.py)
+    st.session_state.quiz = QuizState()
+if 'resume_token' not in st.session_state:
+    st.session_state.resume_token = None
+if 'mode' not in st.session_state:
+    st.session_state.mode = "full"
+if 'topic' not in st.session_state:
+    st.session_state.topic = None
+if 'bank_version' not in st.session_state:
+    # Bank version the running exam is pinned to (None between exams)
+    st.session_state.bank_version = None
+if 'scheduler' not in st.session_state:
+    # Adaptive mode only: spaced-repetition queue (see scheduler.py)
+    st.session_state.scheduler = None
+
+# Keep the resume token in the URL so a reconnect can restore the session
+if st.session_state.resume_token and st.query_params.get("resume") != st.session_state.resume_token:
+    st.query_params["resume"] = st.session_state.resume_token
+elif not st.session_state.resume_token and "resume" in st.query_params:
+    del st.query_params["resume"]
+
+# Default length of an adaptive practice session
+ADAPTIVE_LENGTH = 25
+# Default (maximum) length of a topic quiz
+TOPIC_LENGTH = 25
+# Default length of a mixed exam
+MIXED_LENGTH = 50
+
+# Keys of the answer widgets; cleared when moving to another question so the
+# widgets start from that question's stored selection
+ANSWER_WIDGET_KEYS = ("answer_radio", "answer_multi")
+
+def clear_answer_widgets():
+    for key in ANSWER_WIDGET_KEYS:
+        if key in st.session_state:
+            del st.session_state[key]
+
+def current_question_record():
+    """The Question shown at the current quiz position"""
+    questions = get_questions(st.session_state.selected_test)
+    return questions[st.session_state.quiz.order[st.session_state.current_question]]
+
+def record_selection(question):
+    """Store the answer widget's current value as a bitmask in the quiz state"""
+    if question.multi:
+        selections = st.session_state.get("answer_multi", [])
+    else:
+        selections = [st.session_state.get("answer_radio")]
+    st.session_state.quiz.selections[st.session_state.current_question] = question.selection_mask(selections)
+
+def assign_question(position):
+    """Adaptive mode: have the scheduler pick the question for a new position"""
+    quiz = st.session_state.quiz
+    if quiz.has_flag(position, ASSIGNED):
+        return
+    with metrics.stage("scheduling"):
+        quiz.order[position] = st.session_state.scheduler.next_item()
+    quiz.set_flag(position, ASSIGNED)
 
 # Create callback functions for buttons
+@metrics.timed("callback.start_quiz", callback=True)
 def handle_start_quiz():
+    # Pin the exam to the current bank version so a reload cannot reshuffle it
+    st.session_state.bank_version = get_bank_watcher().current.sha256
+    if st.session_state.selected_test != POOLED_TEST and st.session_state.selected_test not in load_data():
+        # The sheet was removed by a reload after the page was drawn
+        st.session_state.bank_version = None
+        return
     st.session_state.page = "quiz"
     st.session_state.start_time = time.time()
     st.session_state.current_question_start_time = time.time()
     
-    # Create a randomized list of question indices
-    data = load_data()
-    test_data = data[st.session_state.selected_test]
-    num_questions = len(test_data)
-    st.session_state.randomized_questions = list(range(num_questions))
-    random.shuffle(st.session_state.randomized_questions)
+    questions = get_questions(st.session_state.selected_test)
+    if st.session_state.mode == "adaptive":
+        # Questions are picked one at a time from the candidate's answers so far
+        st.session_state.scheduler = AdaptiveScheduler(len(questions))
+        length = st.session_state.get("adaptive_length", ADAPTIVE_LENGTH)
+        st.session_state.quiz = QuizState.unassigned(length, len(questions))
+        assign_question(0)
+    elif st.session_state.mode == "topic":
+        # The best matches for the topic, in random order
+        st.session_state.scheduler = None
+        st.session_state.topic = st.session_state.get("topic_query", "").strip()
+        order = find_topic_questions(st.session_state.topic, st.session_state.get("topic_length", TOPIC_LENGTH))
+        random.shuffle(order)
+        st.session_state.quiz = QuizState(order, len(questions))
+    elif st.session_state.mode == "mixed":
+        # Distinct questions sampled across all sheets
+        st.session_state.scheduler = None
+        order = build_mixed_exam(st.session_state.get("mixed_length", MIXED_LENGTH))
+        st.session_state.quiz = QuizState(order, len(questions))
+    else:
+        # Create a randomized order of question indices
+        st.session_state.scheduler = None
+        st.session_state.quiz = QuizState.shuffled(len(questions))
+    clear_answer_widgets()
+    
+    st.session_state.resume_token = secrets.token_urlsafe(16)
+    checkpoint_session()
 
+@metrics.timed("callback.next_question", callback=True)
 def handle_next_question():
+    if exam_lost():
+        return
     # Save time for current question
     question_time = time.time() - st.session_state.current_question_start_time
-    st.session_state.question_times[st.session_state.current_question] = question_time
+    st.session_state.quiz.times[st.session_state.current_question] = question_time
     
     # Move to next question or finish
-    data = load_data()
-    test_data = data[st.session_state.selected_test]
+    num_questions = len(st.session_state.quiz)
     
     # Safety check - make sure we don't go past the last question
-    if st.session_state.current_question >= len(test_data) - 1:
-        st.session_state.current_question = len(test_data) - 1
+    if st.session_state.current_question >= num_questions - 1:
+        st.session_state.current_question = num_questions - 1
         # Save the total quiz time when finishing
         st.session_state.total_quiz_time = time.time() - st.session_state.start_time
         st.session_state.page = "results"
+        record_finished_attempt()
+        checkpoint_session()
         return
         
     st.session_state.current_question += 1
-    
-    # Reset show_answer for the next question
-    if st.session_state.current_question not in st.session_state.show_answer:
-        st.session_state.show_answer[st.session_state.current_question] = False
+    clear_answer_widgets()
     
     # Check if we need to go to results page
-    if st.session_state.current_question >= len(test_data):
+    if st.session_state.current_question >= num_questions:
         # Save the total quiz time when finishing
         st.session_state.total_quiz_time = time.time() - st.session_state.start_time
         st.session_state.page = "results"
     else:
+        if st.session_state.scheduler is not None:
+            assign_question(st.session_state.current_question)
         st.session_state.current_question_start_time = time.time()
+    checkpoint_session()
 
+@metrics.timed("callback.prev_question", callback=True)
 def handle_prev_question():
+    if exam_lost():
+        return
     # Save time for current question
     question_time = time.time() - st.session_state.current_question_start_time
-    st.session_state.question_times[st.session_state.current_question] = question_time
+    st.session_state.quiz.times[st.session_state.current_question] = question_time
     
     # Move to previous question
     st.session_state.current_question -= 1
+    clear_answer_widgets()
     st.session_state.current_question_start_time = time.time()
+    checkpoint_session()
 
+@metrics.timed("callback.restart_quiz", callback=True)
 def handle_restart_quiz():
+    reset_quiz()
+
+def reset_quiz():
+    """Back to the intro page, dropping the exam and its checkpoint"""
     st.session_state.page = "intro"
     st.session_state.current_question = 0
     st.session_state.score = 0
-    st.session_state.answers = {}
-    st.session_state.question_times = {}
     st.session_state.start_time = None
     st.session_state.current_question_start_time = None
-    st.session_state.show_answer = {}
-    st.session_state.answered_questions = set()
-    st.session_state.multi_select_answers = {}
     st.session_state.total_quiz_time = None
+    st.session_state.quiz = QuizState()
+    st.session_state.scheduler = None
+    st.session_state.topic = None
+    st.session_state.bank_version = None
+    clear_answer_widgets()
+    
+    # The finished exam no longer needs to be resumable
+    store = get_session_store()
+    if store is not None and st.session_state.resume_token:
+        store.delete(st.session_state.resume_token)
+    st.session_state.resume_token = None
 
+@metrics.timed("callback.show_answer", callback=True)
 def handle_show_answer():
-    # Mark this question as answered
-    st.session_state.answered_questions.add(st.session_state.current_question)
-    # Show the answer
-    st.session_state.show_answer[st.session_state.current_question] = True
+    if exam_lost():
+        return
+    quiz = st.session_state.quiz
+    position = st.session_state.current_question
+    question = current_question_record()
+    
+    # Mark this question as answered and remember what was selected
+    quiz.set_flag(position, ANSWERED)
+    record_selection(question)
     
     # Score the question if not already scored
-    if st.session_state.current_question not in st.session_state.answers:
-        # Get current question data
-        data = load_data()
-        test_data = data[st.session_state.selected_test]
-        question_row = test_data.iloc[st.session_state.current_question]
-        
-        # Check if this is a multiple-answer question
-        correct_keys = str(question_row['Key']).split(',')
-        correct_keys = [key.strip() for key in correct_keys]
-        
-        if len(correct_keys) > 1:
-            # Multiple correct answers
-            user_selections = st.session_state.multi_select_answers.get(st.session_state.current_question, [])
-            
-            # Map selected options back to keys
-            option_to_key = {}
-            for key in ['A', 'B', 'C', 'D', 'E']:
-                option_col = f'Option {key}'
-                if option_col in question_row and pd.notna(question_row[option_col]):
-                    option_to_key[question_row[option_col]] = key
-            
-            user_selection_keys = []
-            for selection in user_selections:
-                key = option_to_key.get(selection)
-                if key:
-                    user_selection_keys.append(key)
-            
-            # Sort both lists for comparison
-            user_selection_keys.sort()
-            sorted_correct_keys = sorted(correct_keys)
-            
-            # Check if correct and update score
-            is_correct = user_selection_keys == sorted_correct_keys
-            if is_correct:
+    if not quiz.has_flag(position, SCORED):
+        # Only score questions whose correct option(s) exist
+        with metrics.stage("scoring"):
+            correct = bool(question.answer_mask) and quiz.selections[position] == question.answer_mask
+            if correct:
                 st.session_state.score += 1
-        else:
-            # Single correct answer
-            user_answer = st.session_state.get(f"q{st.session_state.current_question}")
-            correct_key = correct_keys[0]
-            
-            # Check if the correct option column exists
-            option_col = f'Option {correct_key}'
-            if option_col in question_row and pd.notna(question_row[option_col]):
-                correct_option = question_row[option_col]
-                
-                # Check if correct and update score
-                is_correct = user_answer == correct_option
-                if is_correct:
-                    st.session_state.score += 1
         
         # Mark that we've scored this question
-        st.session_state.answers[st.session_state.current_question] = True
-
-# Function to handle multi-select changes
-def update_multi_select():
-    key = f"multi_q{st.session_state.current_question}"
-    if key in st.session_state:
-        selected_options = st.session_state[key]
-        st.session_state.multi_select_answers[st.session_state.current_question] = selected_options
-    else:
-        # If the key doesn't exist yet, initialize with empty list
-        st.session_state.multi_select_answers[st.session_state.current_question] = []
+        quiz.set_flag(position, SCORED)
+        
+        # Adaptive mode: reschedule the question from this first answer
+        if st.session_state.scheduler is not None:
+            with metrics.stage("scheduling"):
+                question_time = time.time() - st.session_state.current_question_start_time
+                st.session_state.scheduler.review(quiz.order[position], position, correct, question_time)
+    checkpoint_session()
+
+# Function to handle answer widget changes
+@metrics.timed("callback.select_answer", callback=True)
+def update_selection():
+    if exam_lost():
+        return
+    record_selection(current_question_record())
+    checkpoint_session()
 
 # Function to calculate time elapsed
 def get_elapsed_time():
@@ -252,16 +538,131 @@ def get_question_time():
         return 0
     return time.time() - st.session_state.current_question_start_time
 
+# Timer template: styled like st.info, ticks in the browser so the server only
+# reruns on real user actions. The starting value comes from the server-side
+# start time; the browser only adds the time since this rerun was rendered.
+TIMER_HTML = """
+<div style="font-family: 'Source Sans Pro', sans-serif; font-size: 1rem;
+            padding: 1rem; border-radius: 0.5rem;
+            background-color: rgba(28, 131, 225, 0.1); color: rgb(0, 66, 128);">
+  {label}: <span id="t">{initial}</span>
+</div>
+<script>
+  const elapsed = {elapsed};
+  const loaded = performance.now();
+  const el = document.getElementById("t");
+  function tick() {{
+    const s = Math.floor(elapsed + (performance.now() - loaded) / 1000);
+    const h = Math.floor(s / 3600), m = Math.floor(s % 3600 / 60), sec = s % 60;
+    el.textContent = h + ":" + String(m).padStart(2, "0") + ":" + String(sec).padStart(2, "0");
+  }}
+  tick();
+  setInterval(tick, 1000);
+</script>
+"""
+
+def render_timer(label, elapsed_seconds):
+    """Show a timer that starts at elapsed_seconds and keeps counting client-side"""
+    components.html(
+        TIMER_HTML.format(label=label, initial=format_time(elapsed_seconds), elapsed=f"{elapsed_seconds:.3f}"),
+        height=60,
+    )
+
+# An exam whose bank version is gone goes back to the intro page with a notice
+exam_lost()
+
+# ADMIN PAGE
+if admin_requested():
+    st.title("Question Analytics")
+    store = get_analytics()
+    data = load_data()
+    sheet = st.selectbox("Select Test", list(data.keys()), key="admin_sheet")
+    
+    if store is None:
+        st.error("The analytics store is not available.")
+    else:
+        report_start = time.perf_counter()
+        hardest = store.hardest(sheet)
+        slowest = store.slowest(sheet)
+        attempts = store.attempt_count(sheet)
+        report_ms = (time.perf_counter() - report_start) * 1000
+        st.caption(f"{attempts} finished attempts · report built in {report_ms:.1f} ms")
+        
+        questions = data[sheet]
+        def report_rows(stats):
+            return [
+                {
+                    "Question": row["question"],
+                    "Text": questions[row["question"] - 1].text[:100] if row["question"] <= len(questions) else "",
+                    "Attempts": row["attempts"],
+                    "Accuracy (%)": round(row["accuracy"] * 100, 1),
+                    "Median time (ms)": round(row["p50_ms"]),
+                    "90th pct time (ms)": round(row["p90_ms"]),
+                }
+                for row in stats
+            ]
+        
+        st.subheader("Hardest questions")
+        st.dataframe(report_rows(hardest), hide_index=True, use_container_width=True)
+        st.subheader("Slowest questions")
+        st.dataframe(report_rows(slowest), hide_index=True, use_container_width=True)
+
+    # Rows the compiler flagged (empty questions, keys pointing at missing options)
+    issues = data.validation_errors(sheet)
+    if issues["total"]:
+        st.subheader("Data issues")
+        st.caption(f"{issues['total']} problem(s) found when the sheet was loaded")
+        st.dataframe(
+            [{"Row": row["row"], "Column": row["column"], "Problem": row["message"]} for row in issues["rows"]],
+            hide_index=True, use_container_width=True,
+        )
+
 # INTRODUCTION PAGE
-if st.session_state.page == "intro":
+elif st.session_state.page == "intro":
     st.title("PMP Practice Exam")
+    notice = st.session_state.pop("notice", None)
+    if notice:
+        st.warning(notice)
     st.write("Welcome to the PMP Practice Exam. This quiz will test your knowledge of project management principles.")
     
     # Load data for test selection
     data = load_data()
     
+    # Mode selection
+    modes = {"Full test": "full", "Adaptive practice": "adaptive", "Topic quiz": "topic", "Mixed exam": "mixed"}
+    mode = st.radio("Mode", list(modes), horizontal=True, key="mode_choice")
+    st.session_state.mode = modes[mode]
+    start_disabled = False
+    
     # Test selection
-    test_name = st.selectbox("Select Test", list(data.keys()))
+    if st.session_state.mode == "adaptive":
+        test_name = st.selectbox("Select Test", [POOLED_TEST] + list(data.keys()))
+        st.number_input("Number of questions", min_value=1, max_value=0xFFFF,
+                        value=ADAPTIVE_LENGTH, key="adaptive_length")
+    elif st.session_state.mode == "topic":
+        # Topic quizzes draw from every sheet
+        test_name = POOLED_TEST
+        topic = st.text_input("Topic", placeholder="e.g. risk register, agile", key="topic_query")
+        limit = st.number_input("Maximum number of questions", min_value=1, max_value=0xFFFF,
+                                value=TOPIC_LENGTH, key="topic_length")
+        if topic.strip():
+            search_start = time.perf_counter()
+            matches = find_topic_questions(topic, limit)
+            search_ms = (time.perf_counter() - search_start) * 1000
+            st.caption(f"{len(matches)} matching questions ({search_ms:.1f} ms)")
+        else:
+            matches = []
+        start_disabled = not matches
+    elif st.session_state.mode == "mixed":
+        # Mixed exams draw from every sheet, skipping reworded duplicates
+        test_name = POOLED_TEST
+        unique = len(set(data.pooled_clusters()))
+        st.number_input("Number of questions", min_value=1, max_value=unique,
+                        value=min(MIXED_LENGTH, unique), key="mixed_length")
+        st.caption(f"{unique} distinct questions across {', '.join(data.pooled().names)} "
+                   f"({len(data.pooled()) - unique} near-duplicates left out)")
+    else:
+        test_name = st.selectbox("Select Test", list(data.keys()))
     st.session_state.selected_test = test_name
     
     # Instructions section
@@ -274,60 +675,53 @@ if st.session_state.page == "intro":
         st.write("3. Click 'Show Answer' to see the correct answer.")
         st.write("4. Some questions may have multiple correct answers.")
         st.write("5. You can only proceed to the next question after viewing the answer.")
+    if st.session_state.mode == "adaptive":
+        st.info("Adaptive practice picks each question from your answers so far: "
+                "missed or slow questions come back sooner, quick correct ones later.")
         
     # Add the start button to the instruction section
-    st.button("Start Quiz", type="primary", key="start_btn", on_click=handle_start_quiz)
+    st.button("Start Quiz", type="primary", key="start_btn", on_click=handle_start_quiz, disabled=start_disabled)
 
 # QUIZ PAGE
 elif st.session_state.page == "quiz":
-    # Load data
-    data = load_data()
-    test_data = data[st.session_state.selected_test]
+    num_questions = len(st.session_state.quiz)
     
     # Quiz header with timer
     col_header, col_timer = st.columns([3, 1])
     with col_header:
-        st.title(f"PMP Practice Exam - {st.session_state.selected_test}")
+        if st.session_state.topic:
+            st.title(f"PMP Practice Exam - Topic: {st.session_state.topic}")
+        else:
+            st.title(f"PMP Practice Exam - {st.session_state.selected_test}")
     with col_timer:
-        elapsed_time = get_elapsed_time()
-        timer_placeholder = st.empty()
-        timer_placeholder.info(f"Total quiz time: {format_time(elapsed_time)}")
+        render_timer("Total quiz time", get_elapsed_time())
     
     # Display current question
-    if st.session_state.current_question < len(test_data):
-        # Get the question index from the randomized list
-        question_index = st.session_state.randomized_questions[st.session_state.current_question]
-        question_row = test_data.iloc[question_index]
-        question_num = question_index + 1  # Original question number (for images)
+    if st.session_state.current_question < num_questions:
+        # The question at this position of the quiz order, with its images
+        # looked up (usually prepared while the previous question was shown)
+        quiz = st.session_state.quiz
+        render = get_render_data(st.session_state.current_question)
+        question = render.question
         display_num = st.session_state.current_question + 1  # Display number (1-based index)
         
         # Question header with timer
         col_q, col_q_timer = st.columns([3, 1])
         with col_q:
-            st.subheader(f"Question {display_num} of {len(test_data)}")
-            st.write(question_row['Question'])
+            st.subheader(f"Question {display_num} of {num_questions}")
+            st.write(question.text)
             
-            # Check for question image in the Pictures folder
-            image_path = get_question_image_path(st.session_state.selected_test, question_num)
-            if image_path:
-                img_b64 = get_image_as_base64(image_path)
-                if img_b64:
-                    st.image(img_b64, caption=f"Question {display_num} Image")
+            # Question image from the Pictures folder
+            if render.image_path:
+                show_image(render.image_path, f"Question {display_num} Image")
                     
         with col_q_timer:
-            question_time = get_question_time()
-            question_timer_placeholder = st.empty()
-            question_timer_placeholder.info(f"Time on question: {format_time(question_time)}")
+            render_timer("Time on question", get_question_time())
         
         # Check if this is a multiple-answer question
-        has_multiple_answers = ',' in str(question_row['Key'])
-        
-        # Get available options (check for Option E)
-        options = []
-        for key in ['A', 'B', 'C', 'D', 'E']:
-            option_col = f'Option {key}'
-            if option_col in question_row and pd.notna(question_row[option_col]):
-                options.append(question_row[option_col])
+        has_multiple_answers = question.multi
+        options = list(question.options)
+        selection_mask = quiz.selections[st.session_state.current_question]
         
         if has_multiple_answers:
             # For multiple answers, use multi-select checkbox
@@ -336,17 +730,19 @@ elif st.session_state.page == "quiz":
                 selected = st.multiselect(
                     "Choose all correct answers:", 
                     options, 
-                    key=f"multi_q{st.session_state.current_question}",
-                    on_change=update_multi_select,
-                    default=st.session_state.multi_select_answers.get(st.session_state.current_question, [])
+                    key="answer_multi",
+                    on_change=update_selection,
+                    default=question.options_for_mask(selection_mask)
                 )
             except Exception as e:
                 st.error(f"Error loading multiple choice options. Please try restarting the quiz.")
-                st.session_state.multi_select_answers[st.session_state.current_question] = []
+                quiz.selections[st.session_state.current_question] = 0
         else:
             # For single answer, use radio button
             try:
-                st.radio("Select your answer:", options, key=f"q{st.session_state.current_question}")
+                selected = question.options_for_mask(selection_mask)
+                index = options.index(selected[0]) if selected else 0
+                st.radio("Select your answer:", options, index=index, key="answer_radio", on_change=update_selection)
             except Exception as e:
                 st.error(f"Error loading answer options. Please try restarting the quiz.")
                 
@@ -365,48 +761,27 @@ elif st.session_state.page == "quiz":
         
         # Next button
         with button_cols[2]:
-            next_label = "Next" if st.session_state.current_question < len(test_data) - 1 else "Finish Quiz"
+            next_label = "Next" if st.session_state.current_question < num_questions - 1 else "Finish Quiz"
             # Only enable Next button if answer has been shown
-            next_disabled = st.session_state.current_question not in st.session_state.answered_questions
+            next_disabled = not quiz.has_flag(st.session_state.current_question, ANSWERED)
             st.button(next_label, key="next_btn", on_click=handle_next_question, disabled=next_disabled)
         
         # Add feedback section below the buttons
-        if st.session_state.current_question in st.session_state.answered_questions:
-            # Get correct answer keys (split by comma if multiple)
-            correct_keys = str(question_row['Key']).split(',')
-            correct_keys = [key.strip() for key in correct_keys]
+        if quiz.has_flag(st.session_state.current_question, ANSWERED):
+            correct_keys = question.correct_keys()
             
             st.markdown("---")  # Add a separator
             
             # Display correct/incorrect feedback
             if has_multiple_answers:
                 # Multiple correct answers
-                user_selections = st.session_state.multi_select_answers.get(st.session_state.current_question, [])
-                
-                # Map selected options back to keys
-                option_to_key = {}
-                for key in ['A', 'B', 'C', 'D', 'E']:
-                    option_col = f'Option {key}'
-                    if option_col in question_row and pd.notna(question_row[option_col]):
-                        option_to_key[question_row[option_col]] = key
-                
-                user_selection_keys = []
-                for selection in user_selections:
-                    key = option_to_key.get(selection)
-                    if key:
-                        user_selection_keys.append(key)
-                
-                # Sort both lists for comparison
-                user_selection_keys.sort()
-                sorted_correct_keys = sorted(correct_keys)
-                
-                is_correct = user_selection_keys == sorted_correct_keys
+                is_correct = selection_mask == question.answer_mask
                 
                 # Get correct answer text
                 correct_answers_text = []
                 for key in correct_keys:
-                    if f'Option {key}' in question_row and pd.notna(question_row[f'Option {key}']):
-                        option_text = question_row[f'Option {key}']
+                    option_text = question.option_text(key)
+                    if option_text is not None:
                         correct_answers_text.append(f"{key}) {option_text}")
                 
                 correct_display = ", ".join(correct_answers_text)
@@ -415,17 +790,14 @@ elif st.session_state.page == "quiz":
                     st.success(f"✓ Correct! The answers are: {correct_display}")
                 else:
                     st.error(f"✗ Incorrect. The correct answers are: {correct_display}")
-            else:
+            elif correct_keys:
                 # Single correct answer
-                user_answer = st.session_state.get(f"q{st.session_state.current_question}")
                 correct_key = correct_keys[0]
                 
-                # Check if the correct option column exists
-                option_col = f'Option {correct_key}'
-                if option_col in question_row and pd.notna(question_row[option_col]):
-                    correct_option = question_row[option_col]
-                    
-                    is_correct = user_answer == correct_option
+                # Check if the correct option exists
+                correct_option = question.option_text(correct_key)
+                if correct_option is not None:
+                    is_correct = selection_mask == question.selection_mask([correct_option])
                     
                     if is_correct:
                         st.success(f"✓ Correct! The answer is: {correct_key}) {correct_option}")
@@ -435,32 +807,21 @@ elif st.session_state.page == "quiz":
             # Show explanation section
             st.subheader("Explanation:")
             
-            # Check for Feedback column first
-            if 'Feedback' in question_row and pd.notna(question_row['Feedback']):
-                st.write(question_row['Feedback'])
-            # Then check for Explanation as fallback
-            elif 'Explanation' in question_row and pd.notna(question_row['Explanation']):
-                st.write(question_row['Explanation'])
+            if question.explanation is not None:
+                st.write(question.explanation)
             else:
                 st.write("No explanation provided for this question.")
                 
-            # Check for feedback/answer images
-            # Try different naming patterns for answer images
-            answer_image_path = get_question_image_path(st.session_state.selected_test, f"{question_num}_answer")
-            if not answer_image_path:
-                answer_image_path = get_question_image_path(st.session_state.selected_test, f"Answer{question_num}")
-            if not answer_image_path:
-                answer_image_path = get_question_image_path(st.session_state.selected_test, f"Picture{question_num}")
-            
-            if answer_image_path:
-                img_b64 = get_image_as_base64(answer_image_path)
-                if img_b64:
-                    st.image(img_b64, caption="Explanation Image")
+            # Feedback/answer image
+            if render.answer_image_path:
+                show_image(render.answer_image_path, "Explanation Image")
+        
+        # Warm up the neighbouring questions while the candidate reads this one
+        prefetch_neighbours(st.session_state.current_question)
 
 # RESULTS PAGE
 elif st.session_state.page == "results":
-    data = load_data()
-    test_data = data[st.session_state.selected_test]
+    num_questions = len(st.session_state.quiz)
     
     st.title("Quiz Results")
     
@@ -472,12 +833,19 @@ elif st.session_state.page == "results":
     total_time = st.session_state.total_quiz_time
     
     # Display results
-    st.success(f"Your score: {st.session_state.score}/{len(test_data)} ({int(st.session_state.score/len(test_data)*100)}%)")
+    st.success(f"Your score: {st.session_state.score}/{num_questions} ({int(st.session_state.score/num_questions*100)}%)")
     st.info(f"Total time: {format_time(total_time)}")
     
     # Calculate average time per question
-    avg_time = total_time / len(test_data)
+    avg_time = total_time / num_questions
     st.info(f"Average time per question: {format_time(avg_time)}")
     
     # Restart button
-    st.button("Restart Quiz", key="restart_btn", on_click=handle_restart_quiz) 
\ No newline at end of file
+    st.button("Restart Quiz", key="restart_btn", on_click=handle_restart_quiz) 
+
+# Record this rerun's stage timings and count it against the session
+if metrics.ENABLED:
+    if 'metrics_session' not in st.session_state:
+        st.session_state.metrics_session = uuid.uuid4().hex[:12]
+    st.session_state.rerun_count = st.session_state.get('rerun_count', 0) + 1
+    metrics.end_rerun(st.session_state.metrics_session, st.session_state.rerun_count, st.session_state.page)
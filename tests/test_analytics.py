@@ -0,0 +1,10 @@
+from analytics import AnalyticsStore
+
+
+def test_attempt_on_a_sheet_past_65535_rows(tmp_path):
+    store = AnalyticsStore(str(tmp_path / "analytics.db"))
+    store.record_attempt("Big", "v1", 1, 50.0, [(70000, True, 20.0), (3, False, 30.0)])
+    assert store.attempt_count("Big") == 1
+    hardest = store.hardest("Big")
+    assert [row["question"] for row in hardest] == [3, 70000]
+    assert hardest[1]["accuracy"] == 1.0
@@ -0,0 +1,64 @@
+import os
+import shutil
+import time
+
+import pytest
+
+import question_bank
+from question_bank import SHEET_CACHE_DIR, compile_snapshot, list_sources, prune_snapshots
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def bank(tmp_path):
+    """The shipped workbook in its own bank directory, with an empty snapshot directory"""
+    bank_dir = tmp_path / "bank"
+    bank_dir.mkdir()
+    for name in os.listdir(REPO):
+        if name.endswith(".xlsx"):
+            shutil.copy(os.path.join(REPO, name), bank_dir)
+    return str(bank_dir), str(tmp_path / "cache")
+
+
+def sheet_files(snapshot_dir):
+    return sorted(os.listdir(os.path.join(snapshot_dir, SHEET_CACHE_DIR)))
+
+
+def test_sheet_pruned_while_compiling_is_compiled_again(bank, monkeypatch):
+    bank_dir, snapshot_dir = bank
+    sources = list_sources(bank_dir)
+    snapshot = compile_snapshot(sources, snapshot_dir)
+    expected = sorted(question_bank.QuestionBank(snapshot))
+    shutil.rmtree(snapshot)
+    compile_changed_sheets = question_bank.compile_changed_sheets
+    calls = []
+
+    def compile_then_lose_a_sheet(sources, sheet_dir):
+        compiled = compile_changed_sheets(sources, sheet_dir)
+        if not calls:
+            # Another worker's prune removes a segment before it is assembled
+            os.remove(os.path.join(sheet_dir, [name for name in sheet_files(snapshot_dir) if name.endswith(".seg")][0]))
+        calls.append(sheet_dir)
+        return compiled
+
+    monkeypatch.setattr(question_bank, "compile_changed_sheets", compile_then_lose_a_sheet)
+    snapshot = compile_snapshot(sources, snapshot_dir)
+    assert sorted(question_bank.QuestionBank(snapshot)) == expected
+
+
+def test_prune_keeps_recent_unused_sheets(bank):
+    bank_dir, snapshot_dir = bank
+    sources = list_sources(bank_dir)
+    version = question_bank.bank_version(sources)
+    compile_snapshot(sources, snapshot_dir)
+    sheet_dir = os.path.join(snapshot_dir, SHEET_CACHE_DIR)
+    fresh = os.path.join(sheet_dir, "f" * 32 + ".seg")
+    stale = os.path.join(sheet_dir, "e" * 32 + ".seg")
+    for path in (fresh, stale):
+        open(path, "wb").close()
+    old = time.time() - question_bank.SHEET_GRACE - 60
+    os.utime(stale, (old, old))
+    prune_snapshots(version, snapshot_dir)
+    assert os.path.exists(fresh)
+    assert not os.path.exists(stale)
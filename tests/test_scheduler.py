@@ -0,0 +1,43 @@
+import random
+
+from scheduler import MAX_INTERVAL, AdaptiveScheduler
+
+
+def run_session(scheduler, steps, correct=True, seconds=30):
+    for step in range(steps):
+        item = scheduler.next_item()
+        scheduler.review(item, step, correct, seconds)
+
+
+def test_long_session_on_small_pool_round_trips():
+    # 26 questions answered correctly overflowed the packed keys after 416 steps
+    scheduler = AdaptiveScheduler(26, random.Random(1))
+    run_session(scheduler, 5000)
+    restored = AdaptiveScheduler.from_bytes(scheduler.to_bytes())
+    assert restored.heap == scheduler.heap
+    assert restored.ease == scheduler.ease
+    assert restored.interval == scheduler.interval
+    assert restored.reps == scheduler.reps
+    assert max(scheduler.interval) <= MAX_INTERVAL
+
+
+def test_due_steps_stay_bounded():
+    scheduler = AdaptiveScheduler(55, random.Random(2))
+    run_session(scheduler, 0xFFFF)
+    assert len(scheduler) == 55
+    assert scheduler.next_item() in range(55)
+    AdaptiveScheduler.from_bytes(scheduler.to_bytes())
+
+
+def test_missed_item_comes_back_soon():
+    scheduler = AdaptiveScheduler(100, random.Random(3))
+    item = scheduler.next_item()
+    scheduler.review(item, 0, False, 30)
+    seen = [scheduler.next_item() for _ in range(4)]
+    assert item in seen
+
+
+def test_empty_scheduler():
+    scheduler = AdaptiveScheduler()
+    assert scheduler.next_item() is None
+    assert scheduler.peek() is None
@@ -0,0 +1,36 @@
+import pytest
+
+from search_index import SearchIndex, stem, tokenize
+
+
+@pytest.mark.parametrize("words", [
+    ("process", "processes", "processing"),
+    ("plan", "plans", "planning", "planned"),
+    ("analysis", "analyses"),
+    ("policy", "policies"),
+    ("apply", "applied", "applies"),
+    ("issue", "issues"),
+    ("status", "statuses"),
+    ("schedule", "scheduled", "scheduling"),
+    ("commit", "committed"),
+])
+def test_word_forms_share_a_stem(words):
+    assert len({stem(word) for word in words}) == 1
+
+
+def test_stem_keeps_words_apart():
+    assert stem("install") == stem("installed") != stem("instal")
+    assert stem("success") == "success"
+
+
+class Doc:
+    def __init__(self, text):
+        self.text = text
+        self.options = ()
+        self.explanation = ""
+
+
+def test_search_matches_other_word_forms():
+    index = SearchIndex([Doc("Planning the processes"), Doc("Budget review"), Doc("Risk register")])
+    assert [doc_id for doc_id, _ in index.search("process plan")] == [0]
+    assert tokenize("The planned process") == ["plan", "process"]
@@ -0,0 +1,159 @@
+"""
+Process-wide shared resources, warmed up at server launch.
+
+The question bank watcher and the image index are created once per process
+through shared(). serve.py builds them in parallel before the first session
+connects, so no candidate pays for a cold load_data(). With QUIZ_READY_PORT
+set, GET /ready on that port answers 503 until the warm-up is done and the
+Streamlit server answers its own health check, then 200. Point the load
+balancer's health check there.
+
+Under plain `streamlit run`, nothing is warmed and shared() builds each
+resource on first use, as before.
+"""
+import logging
+import os
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+READY_PORT = os.environ.get("QUIZ_READY_PORT")
+
+
+def _bank_watcher():
+    from question_bank import BankWatcher
+
+    return BankWatcher()
+
+
+def _image_index():
+    from image_assets import PICTURES_DIR, ImageIndex
+
+    return ImageIndex(PICTURES_DIR)
+
+
+# Resources warmed at launch, by name
+RESOURCES = {
+    "bank_watcher": _bank_watcher,
+    "image_index": _image_index,
+}
+
+_instances = {}
+_locks = {name: threading.Lock() for name in RESOURCES}
+_ready = threading.Event()
+_timings = {}
+_server = None
+_listening = False
+
+
+def shared(name):
+    """The process's instance of a resource, built on first use (once, even under concurrent calls)"""
+    instance = _instances.get(name)
+    if instance is not None:
+        return instance
+    with _locks[name]:
+        if name not in _instances:
+            _instances[name] = RESOURCES[name]()
+        return _instances[name]
+
+
+def warm_up():
+    """
+    Build every resource in parallel, one thread each, and mark the process
+    ready once all of them exist (a failure leaves it unready). Returns the
+    seconds each resource took.
+    """
+    failed = []
+
+    def build(name):
+        start = time.perf_counter()
+        try:
+            shared(name)
+        except Exception:
+            logging.getLogger(__name__).exception("Warm-up of %s failed", name)
+            failed.append(name)
+        finally:
+            _timings[name] = time.perf_counter() - start
+
+    threads = [threading.Thread(target=build, args=(name,), name=f"warmup-{name}") for name in RESOURCES]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if not failed:
+        _ready.set()
+    return dict(_timings)
+
+
+def _app_listening():
+    """Whether the Streamlit server in this process answers its own health check"""
+    global _listening
+    if not _listening:
+        try:
+            from streamlit import config
+            from streamlit.runtime import Runtime
+
+            # The runtime exists once the CLI has loaded its options (the port)
+            if not Runtime.exists():
+                return False
+            base = config.get_option("server.baseUrlPath").strip("/")
+            url = f"http://127.0.0.1:{config.get_option('server.port')}/{base + '/' if base else ''}_stcore/health"
+            with urllib.request.urlopen(url, timeout=1) as response:
+                _listening = response.status == 200
+        except OSError:
+            pass
+    return _listening
+
+
+def is_ready():
+    """Warm-up done and the app server accepting connections"""
+    return _ready.is_set() and _app_listening()
+
+
+class _ReadyHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/ready":
+            self.send_error(404)
+            return
+        status, body = (200, b"ready\n") if is_ready() else (503, b"warming up\n")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_readiness(port=READY_PORT):
+    """Start the /ready endpoint in a daemon thread (no-op without a port)"""
+    global _server
+    if not port or _server is not None:
+        return
+    try:
+        _server = ThreadingHTTPServer(("", int(port)), _ReadyHandler)
+    except OSError as e:
+        logging.getLogger(__name__).warning("Readiness endpoint not started: %s", e)
+        return
+    threading.Thread(target=_server.serve_forever, name="quiz-ready", daemon=True).start()
+
+
+def start():
+    """Serve /ready and warm up in the background; returns the warm-up thread"""
+    serve_readiness()
+    launched = time.perf_counter()
+
+    def run():
+        timings = warm_up()
+        parts = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in timings.items())
+        elapsed = (time.perf_counter() - launched) * 1000
+        if _ready.is_set():
+            logging.getLogger(__name__).info("Warm-up done in %.0f ms (%s)", elapsed, parts)
+        else:
+            logging.getLogger(__name__).warning("Warm-up FAILED in %.0f ms (%s), staying unready", elapsed, parts)
+
+    thread = threading.Thread(target=run, name="warmup", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,134 @@
+"""
+Discovery and change detection for the workbooks that make up the bank.
+
+Every .xlsx file in the bank directory is a source of sheets. Each sheet gets
+a content fingerprint computed straight from the workbook's zip entries
+(the sheet XML with shared-string references replaced by digests of the
+strings they point to), so an edit to one sheet changes only that sheet's
+fingerprint and the other sheets are not re-parsed.
+"""
+import hashlib
+import os
+import posixpath
+import re
+import zipfile
+
+# Directory scanned for workbooks (QUIZ_BANK_DIR), and the main workbook,
+# whose sheets keep their plain names
+BANK_DIR = os.environ.get("QUIZ_BANK_DIR", ".")
+EXCEL_FILE = "PMP Practice Exam Question Bank_Update 2023 (1).xlsx"
+
+_SHEET = re.compile(rb"<sheet\b[^>]*>")
+_RELATIONSHIP = re.compile(rb"<Relationship\b[^>]*>")
+# Attribute order varies between the programs that write workbooks
+_ATTRIBUTE = re.compile(rb'\s([\w:]+)="([^"]*)"')
+_SHARED_STRING = re.compile(rb"<si>(.*?)</si>|<si\s*/>", re.S)
+# Zip members are read in chunks of this many bytes, so fingerprinting a huge
+# sheet needs memory for one chunk plus a STRING_DIGEST per shared string
+CHUNK_SIZE = 1 << 20
+STRING_DIGEST = 16
+_SHARED_CELL = re.compile(rb'(<c\b[^>]*\bt="s"[^>]*>\s*<v>)(\d+)(</v>)')
+
+
+def _unescape(name):
+    return (name.replace(b"&lt;", b"<").replace(b"&gt;", b">").replace(b"&quot;", b'"')
+            .replace(b"&apos;", b"'").replace(b"&amp;", b"&").decode("utf-8"))
+
+
+def discover_workbooks(bank_dir=BANK_DIR):
+    """Workbook paths in the bank directory, the main workbook first"""
+    names = sorted(
+        name for name in os.listdir(bank_dir)
+        if name.lower().endswith(".xlsx") and not name.startswith("~$")
+    )
+    names.sort(key=lambda name: name != EXCEL_FILE)
+    return [os.path.join(bank_dir, name) for name in names]
+
+
+def workbook_stamps(paths):
+    """Cheap change marker (path, mtime, size) for each workbook"""
+    stamps = []
+    for path in paths:
+        stat = os.stat(path)
+        stamps.append((path, stat.st_mtime_ns, stat.st_size))
+    return tuple(stamps)
+
+
+def display_name(path, sheet):
+    """Name a sheet is offered under: plain for the main workbook, prefixed otherwise"""
+    if os.path.basename(path) == EXCEL_FILE:
+        return sheet
+    return f"{os.path.splitext(os.path.basename(path))[0]}: {sheet}"
+
+
+def sheet_fingerprints(path):
+    """
+    [(sheet name, content fingerprint)] of a workbook, in workbook order.
+    Raises ValueError for a file that is not a readable workbook (e.g. one
+    caught in the middle of being saved).
+    """
+    try:
+        return _sheet_fingerprints(path)
+    except (zipfile.BadZipFile, KeyError, IndexError) as e:
+        raise ValueError(f"{path} is not a readable workbook ({e})") from e
+
+
+def _chunks(stream, end_tag):
+    """Read a zip member in chunks cut after end_tag, so no element straddles two chunks"""
+    tail = b""
+    while True:
+        data = stream.read(CHUNK_SIZE)
+        if not data:
+            if tail:
+                yield tail
+            return
+        data = tail + data
+        cut = data.rfind(end_tag)
+        if cut < 0:
+            tail = data
+            continue
+        cut += len(end_tag)
+        yield data[:cut]
+        tail = data[cut:]
+
+
+def _shared_string_digests(archive):
+    # One fixed-size digest per shared string instead of the strings themselves
+    digests = bytearray()
+    with archive.open("xl/sharedStrings.xml") as stream:
+        for chunk in _chunks(stream, b"</si>"):
+            for match in _SHARED_STRING.finditer(chunk):
+                digests += hashlib.blake2b(match.group(1) or b"", digest_size=STRING_DIGEST).digest()
+    return digests
+
+
+def _sheet_fingerprints(path):
+    with zipfile.ZipFile(path) as archive:
+        names = set(archive.namelist())
+        workbook = archive.read("xl/workbook.xml")
+        targets = {}
+        for tag in _RELATIONSHIP.findall(archive.read("xl/_rels/workbook.xml.rels")):
+            attributes = dict(_ATTRIBUTE.findall(tag))
+            targets[attributes[b"Id"]] = attributes[b"Target"]
+        digests = bytearray()
+        if "xl/sharedStrings.xml" in names:
+            digests = _shared_string_digests(archive)
+
+        def substitute(match):
+            start = int(match.group(2)) * STRING_DIGEST
+            if start + STRING_DIGEST > len(digests):
+                raise IndexError(f"shared string {match.group(2).decode()} out of range")
+            return match.group(1) + bytes(digests[start:start + STRING_DIGEST]) + match.group(3)
+
+        fingerprints = []
+        for tag in _SHEET.findall(workbook):
+            attributes = dict(_ATTRIBUTE.findall(tag))
+            name, rel_id = attributes[b"name"], attributes[b"r:id"]
+            target = targets[rel_id].decode("utf-8")
+            member = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join("xl", target))
+            content = hashlib.sha256()
+            with archive.open(member) as stream:
+                for chunk in _chunks(stream, b"</c>"):
+                    content.update(_SHARED_CELL.sub(substitute, chunk))
+            fingerprints.append((_unescape(name), content.hexdigest()))
+    return fingerprints